@@ -1,5 +1,11 @@
-from utils import Argument, StaticValidators
-from augmentation import augmentation, save_images
+from utils import Argument, StaticValidators, run_jobs
+from augmentation import (augmentation, save_images, AUGMENTATION_NAMES,
+                          plan_balance, save_plan, load_plan, print_plan)
+from storage import ShardWriter, Catalog
+import contextlib
+import hashlib
+import io
+import random
 import sys
 import os
 import matplotlib
@@ -31,49 +37,269 @@ from an image passed as parameters")
     cls.add_argument("--skip-flip",
                      help="Skip the flip augmentation",
                      action="store_true")
+    cls.add_argument("--shards",
+                     help="Pack the images into shard files in this \
+directory instead of saving them next to the originals",
+                     type=str)
+    cls.add_argument("--workers",
+                     help="Number of processes used for a directory",
+                     type=int, default=1)
+    cls.add_argument("--seed",
+                     help="Seed of the random augmentations, \
+a run with the same seed creates the same images",
+                     type=int)
+    cls.add_argument("--balance",
+                     help="Only create the augmentations each class of a \
+directory needs to reach this number of images, the size of the largest \
+class if no number is given",
+                     type=int, nargs="?", const=0)
+    cls.add_argument("--plan",
+                     help="File the balancing plan is written to, or plan \
+to run on the directory without --balance",
+                     type=str)
+    cls.add_argument("--catalog",
+                     help="Index the images and the augmentation each one \
+came from in this dataset catalog",
+                     type=str)
     args = cls.get_args()
     cls.add_validator(StaticValidators.validate_path, args.file)
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.workers, 1, None))
+    if args.max is not None:
+        cls.add_validator(StaticValidators.validate_number,
+                          (args.max, 1, None))
+    if args.balance is not None or args.plan is not None:
+        cls.add_validator(StaticValidators.validate_path_dir, args.file)
+    if args.balance is not None:
+        cls.add_validator(StaticValidators.validate_number,
+                          (args.balance, 0, None))
     cls.validate()
+    if args.max is not None and (args.balance is not None or
+                                 args.plan is not None):
+        raise ValueError("--max cannot be used with --balance or --plan, \
+which decide the number of images themselves.")
+    if args.seed is not None and args.plan is not None and \
+            args.balance is None:
+        raise ValueError("--seed cannot be used to run a --plan, \
+which is run with the seed it was written with.")
     return args
 
 
-def augmentation_dir(path, skip):
+def image_seed(seed, relative_path):
+    """
+    This function derives the seed of one image from the seed of the
+    run and its path, so its augmentations do not depend on the order
+    or the process the images are augmented in.
+    """
+    digest = hashlib.sha256(f"{seed}:{relative_path}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def augmentation_name(output_path):
+    """
+    This function returns the name of the augmentation of an output.
+    """
+    return os.path.splitext(output_path)[0].rsplit("_", 1)[-1]
+
+
+def encode_images(images):
+    """
+    This function encodes augmented images as JPEG,
+    keyed by the name of their augmentation.
+    """
+    encoded = []
+    for output_path, image in images:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        encoded.append((augmentation_name(output_path), buffer.getvalue()))
+    return encoded
+
+
+def catalog_augmentations(catalog, saved):
+    """
+    This function indexes the saved outputs and their sources in the
+    catalog and records the image and augmentation each output came
+    from, without listing their directory.
+    """
+    catalog.add([image for pair in saved for image in pair])
+    catalog.record_origin([(output_path, img_path,
+                            augmentation_name(output_path))
+                           for img_path, output_path in saved],
+                          "augmentation")
+
+
+def shard_images(writer, img_path, root, encoded):
+    """
+    This function packs an image and its encoded augmentations into
+    shards, the image as the 'original' variant and each augmentation
+    as the variant of its name.
+    """
+    image_id = os.path.splitext(os.path.relpath(img_path, root))[0]
+    label = os.path.basename(os.path.dirname(os.path.abspath(img_path)))
+    with open(img_path, "rb") as f:
+        writer.write(image_id, label, "original", f.read())
+    for variant, data in encoded:
+        writer.write(image_id, label, variant, data)
+
+
+def augmentation_file(job):
+    """
+    This function augments one image with its own random generator,
+    keeping only its first limit augmentations. They are saved next
+    to the image and their paths returned, or returned encoded when
+    they go to shards.
+    """
+    img_path, skip, seed, limit, pack = job
+    images = augmentation(img_path, True, skip, random.Random(seed))[:limit]
+    if pack:
+        return encode_images(images)
+    save_images(images)
+    return [output_path for output_path, _ in images]
+
+
+def augmentation_dir(path, skip, writer=None, workers=1, seed=None,
+                     catalog=None):
     """
     This function creates a list of images from a directory.
+    The images are augmented in sorted order across workers processes,
+    each with a seed derived from seed and its path, so a run gives
+    the same images whatever the number of workers.
+    With skip["max"], the first images are augmented until exactly
+    that many augmented images are created.
+    The images are packed into the shards of writer if given,
+    and indexed in catalog if given.
     """
     allowed_extensions = (".jpg", ".JPG", ".jpeg")
-    count = 0
+    img_paths = []
     for root, dirs, files in os.walk(path):
-        for file in files:
-            if file.endswith(allowed_extensions):
-                img_path = os.path.join(root, file)
-                images = augmentation(img_path, True, skip)
-                count += len(images)
+        dirs.sort()
+        img_paths += [os.path.join(root, file) for file in sorted(files)
+                      if file.endswith(allowed_extensions)]
+
+    nb_augmentations = sum(skip.get(name, None) is not True
+                           for name in AUGMENTATION_NAMES)
+    limit = skip.get("max", None)
+    if limit is None:
+        limit = nb_augmentations * len(img_paths)
+    jobs = []
+    for index, img_path in enumerate(img_paths):
+        remaining = limit - index * nb_augmentations
+        if remaining <= 0:
+            break
+        jobs.append((img_path, skip,
+                     image_seed(seed, os.path.relpath(img_path, path)),
+                     min(remaining, nb_augmentations), writer is not None))
+
+    count = run_augmentations(path, jobs, writer, workers, catalog)
+    if skip.get("max", None) is not None and count >= skip["max"]:
+        print(f"Max number of images reached: {count}")
+
+
+def augmentation_plan(path, plan, writer=None, workers=1, catalog=None):
+    """
+    This function creates the augmentations of a balancing plan,
+    only the operations planned for each image.
+    """
+    jobs = [(os.path.join(path, job["path"]),
+             {name: name not in job["operations"]
+              for name in AUGMENTATION_NAMES},
+             image_seed(plan["seed"], job["path"]),
+             len(job["operations"]), writer is not None)
+            for job in plan["jobs"]]
+    run_augmentations(path, jobs, writer, workers, catalog)
+
+
+def run_augmentations(path, jobs, writer=None, workers=1, catalog=None):
+    """
+    This function runs augmentation jobs across workers processes
+    and returns the number of augmented images created.
+    """
+    count = 0
+    failed = 0
+    saved = []
+    # Results are packed in job order so the shards do not depend
+    # on the order the workers finish in
+    done = dict()
+    next_index = 0
+    indices = {job[0]: index for index, job in enumerate(jobs)}
+    for job, result, error in run_jobs(augmentation_file, jobs, workers):
+        if error is not None:
+            failed += 1
+            print(f"Failed {job[0]}: {str(error)}", file=sys.stderr)
+            result = None
+        else:
+            count += len(result)
+            if writer is None:
+                saved += [(job[0], output_path) for output_path in result]
+        done[indices[job[0]]] = result
+        while next_index in done:
+            result = done.pop(next_index)
+            if writer is not None and result is not None:
+                shard_images(writer, jobs[next_index][0], path, result)
+            next_index += 1
+    print(f"Augmented {len(jobs) - failed}/{len(jobs)} images "
+          f"into {count} images.")
+    if catalog is not None:
+        catalog_augmentations(catalog, saved)
+    return count
+
+
+def main(args):
+    skip = {
+        "crop": args.skip_crop,
+        "shear": args.skip_shear,
+        "blur": args.skip_blur,
+        "flip": args.skip_flip,
+    }
+    # A plan run without --balance uses the seed recorded in the plan
+    if args.seed is None and (args.plan is None or args.balance is not None):
+        args.seed = random.randrange(2 ** 32)
+        print(f"Seed: {args.seed}")
+    # The shard writer keeps the previous shards if anything fails
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(ShardWriter(args.shards)) \
+            if args.shards is not None else None
+        catalog = stack.enter_context(Catalog(args.catalog)) \
+            if args.catalog is not None else None
+        if args.balance is not None:
+            plan = plan_balance(args.file, args.balance or None, skip,
+                                args.seed)
+            plan_path = args.plan or "augmentation_plan.json"
+            save_plan(plan, plan_path)
+            print_plan(plan)
+            print(f"Plan saved to {plan_path}")
+            augmentation_plan(args.file, plan, writer, args.workers,
+                              catalog)
+        elif args.plan is not None:
+            plan = load_plan(args.plan)
+            print_plan(plan)
+            augmentation_plan(args.file, plan, writer, args.workers,
+                              catalog)
+        elif os.path.isdir(args.file):
+            augmentation_dir(args.file, skip={**skip, "max": args.max},
+                             writer=writer, workers=args.workers,
+                             seed=args.seed, catalog=catalog)
+        else:
+            images = augmentation(args.file, skip=skip, rng=random.Random(
+                image_seed(
+                    args.seed, os.path.basename(args.file))))
+            if writer is not None:
+                shard_images(writer, args.file, os.path.dirname(args.file),
+                             encode_images(images))
+            else:
                 save_images(images)
-                if skip.get("max", None) is not None and count >= skip["max"]:
-                    print(f"Max number of images reached: {count}")
-                    break
+            if catalog is not None:
+                saved = [] if writer is not None else [
+                    (args.file, output_path) for output_path, _ in images]
+                catalog_augmentations(catalog, saved)
+    if writer is not None:
+        print(f"Packed {writer.count} images into {args.shards}")
 
 
 if __name__ == "__main__":
     try:
         args = arguments_logic()
-        if os.path.isdir(args.file):
-            augmentation_dir(args.file, skip={
-                "crop": args.skip_crop,
-                "shear": args.skip_shear,
-                "blur": args.skip_blur,
-                "flip": args.skip_flip,
-                "max": args.max
-            })
-        else:
-            images = augmentation(args.file, skip={
-                "crop": args.skip_crop,
-                "shear": args.skip_shear,
-                "blur": args.skip_blur,
-                "flip": args.skip_flip
-            })
-            save_images(images)
+        main(args)
         exit(0)
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
@@ -1,5 +1,6 @@
 from utils import Argument, StaticValidators
-from distribution import distribution, plot_distribution
+from distribution import distribution, plot_distribution, DEFAULT_INDEX
+from storage import Catalog
 import sys
 import matplotlib
 
@@ -14,8 +15,39 @@ def arguments_logic():
         "Path to the directory containing the dataset",
         default="data/"
     )
+    cls.add_argument(
+        "--index",
+        type=str,
+        help="Path to the index of the scanned directories",
+        default=DEFAULT_INDEX
+    )
+    cls.add_argument(
+        "--no_index",
+        action="store_true",
+        help="Scan the whole directory without reading nor writing \
+the index",
+    )
+    cls.add_argument(
+        "--workers",
+        type=int,
+        help="Number of threads scanning the class directories",
+        default=8
+    )
+    cls.add_argument(
+        "--catalog",
+        type=str,
+        help="Count the images from this dataset catalog instead of \
+scanning the directory",
+    )
+    cls.add_argument(
+        "--refresh_catalog",
+        action="store_true",
+        help="Index the directory again in the catalog before counting",
+    )
     args = cls.get_args()
     cls.add_validator(StaticValidators.validate_path_dir, args.directory)
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.workers, 1, None))
     cls.validate()
     return args
 
@@ -23,7 +55,19 @@ def arguments_logic():
 if __name__ == "__main__":
     try:
         args = arguments_logic()
-        dist = distribution(args.directory)
+        if args.catalog is not None:
+            with Catalog(args.catalog) as catalog:
+                if args.refresh_catalog:
+                    catalog.update(args.directory, args.workers)
+                dist = catalog.distribution(args.directory)
+            if len(dist) == 0:
+                raise AssertionError(f"No images of {args.directory} in \
+{args.catalog}, index them with --refresh_catalog.")
+            print(dist)
+        else:
+            dist = distribution(args.directory,
+                                None if args.no_index else args.index,
+                                args.workers)
         plot_distribution(dist)
         exit(0)
     except Exception as e:
@@ -1,7 +1,17 @@
-from utils import Argument, StaticValidators
-from transformation import transformation
+from utils import Argument, StaticValidators, print_progress, run_jobs
+from transformation import (transformation, configure_segmentation,
+                            segmentation_stats, configure_mask_cache,
+                            get_mask_cache, output_filename, DEFAULT_OUTPUTS,
+                            Manifest, file_hash, pending_transformations,
+                            configure_backend, ImgTransformation, read_image,
+                            save_landmarks, configure_writer, encode_image,
+                            segmentation_settings, writer_settings,
+                            IMAGE_FORMATS)
+from storage import ShardWriter, Catalog
 import sys
 import os
+import time
+import cv2
 import matplotlib
 
 matplotlib.use('TkAgg')
@@ -37,8 +47,113 @@ from an image/dir passed as parameters")
         action="store_true",
         help="Do the no_bg transformation",
     )
+    cls.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes used for a directory",
+        default=1
+    )
+    cls.add_argument(
+        "--model",
+        type=str,
+        help="rembg model used to remove the background",
+        default="u2net"
+    )
+    cls.add_argument(
+        "--onnx_threads",
+        type=int,
+        help="Number of ONNX threads used by the rembg model",
+    )
+    cls.add_argument(
+        "--segmentation_scale",
+        type=float,
+        help="Scale the background is removed at, between 0 and 1, \
+the mask is upsampled back to the image size",
+        default=1.0
+    )
+    cls.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the outputs recorded in the manifest of -dst \
+without transforming anything",
+    )
+    cls.add_argument(
+        "--landmarks",
+        type=str,
+        help="Export the pseudolandmarks of a directory to this .npz file",
+    )
+    cls.add_argument(
+        "--backend",
+        type=str,
+        help="Backend of the mask operations, 'plantcv' or 'native'",
+        default="plantcv"
+    )
+    cls.add_argument(
+        "--cache_dir",
+        type=str,
+        help="Directory of the leaf mask cache",
+        default=os.path.join(".cache", "masks")
+    )
+    cls.add_argument(
+        "--cache_size",
+        type=int,
+        help="Maximum size of the leaf mask cache in MB",
+        default=512
+    )
+    cls.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Do not read nor write the leaf mask cache",
+    )
+    cls.add_argument(
+        "--shards",
+        type=str,
+        help="Pack the outputs of a directory into shard files in this \
+directory instead of writing one file per output",
+    )
+    cls.add_argument(
+        "--writer_threads",
+        type=int,
+        help="Number of threads encoding and writing the outputs, \
+0 to write them synchronously",
+        default=2
+    )
+    cls.add_argument(
+        "--image_format",
+        type=str,
+        help=f"Format of the outputs. Between {list(IMAGE_FORMATS)}",
+        default="jpg"
+    )
+    cls.add_argument(
+        "--quality",
+        type=int,
+        help="Quality of the jpg and webp outputs, between 0 and 100",
+        default=95
+    )
+    cls.add_argument(
+        "--catalog",
+        type=str,
+        help="Index the images of a directory and the transformation \
+each output came from in this dataset catalog",
+    )
     args = cls.get_args()
     cls.add_validator(StaticValidators.validate_path, args.src)
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.workers, 1, None))
+    if args.onnx_threads is not None:
+        cls.add_validator(StaticValidators.validate_number,
+                          (args.onnx_threads, 1, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.cache_size, 1, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.writer_threads, 0, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.quality, 0, 100))
+    if not 0 < args.segmentation_scale <= 1:
+        raise ValueError("The segmentation scale must be in ]0, 1].")
+    if args.image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Invalid image format '{args.image_format}'. \
+Choose from {list(IMAGE_FORMATS)}.")
     cls.validate()
     transformations = set()
     if args.mask:
@@ -50,39 +165,321 @@ from an image/dir passed as parameters")
     return args, transformations
 
 
-def transformation_dir(path, output_dir, transformations):
+def list_images(path, output_dir):
     """
-    This function creates a list of images from a directory.
+    This function lists the images of a directory with the basename
+    of their outputs, keeping the sub-directories layout.
     """
-    count = 0
+    jobs = []
     allowed_extensions = (".jpg", ".JPG", ".jpeg")
     for root, dirs, files in os.walk(path):
-        for file in files:
+        dirs.sort()
+        for file in sorted(files):
             if file.endswith(allowed_extensions):
                 img_path = os.path.join(root, file)
                 relative_path = os.path.commonpath([path, root])
                 new_path = os.path.relpath(root, relative_path)
                 output_subdir = os.path.join(
                     output_dir, new_path) if new_path != "." else output_dir
-                if not os.path.exists(output_subdir):
-                    os.makedirs(output_subdir)
                 output_file_basename = os.path.join(
-                    output_subdir, file[:-4])
-                transformation(img_path, output_file_basename,
-                               "print", transformations)
+                    output_subdir, os.path.splitext(file)[0])
+                jobs.append((img_path, output_file_basename))
+    return jobs
+
+
+def transformation_file(job):
+    """
+    This function transforms one image of a directory run,
+    doing only the transformations its manifest entry lacks,
+    and returns its pseudolandmarks if they are exported.
+    """
+    img_path, output_file_basename, transformations, entry, output_dir, \
+        export_landmarks = job
+    input_hash = file_hash(img_path)
+    settings = output_settings()
+    pending = pending_transformations(entry, output_dir, input_hash,
+                                      transformations, settings)
+    landmarks = None
+    if len(pending) > 0 or export_landmarks:
+        cls = ImgTransformation(read_image(img_path), output_file_basename,
+                                "print")
+        cls.outputs(pending, print=True)
+        if export_landmarks:
+            landmarks = cls.landmarks()
+    outputs = {name: output_filename(output_file_basename, name)
+               for name in pending}
+    return input_hash, outputs, landmarks, settings, worker_stats()
+
+
+def shard_file(job):
+    """
+    This function transforms one image and returns its outputs
+    encoded in the output image format.
+    """
+    img_path, transformations = job
+    cls = ImgTransformation(read_image(img_path))
+    images = cls.outputs(transformations)
+    return {name: encode_image(img) for name, img in images.items()}, \
+        worker_stats()
+
+
+def verify_file(job):
+    """
+    This function checks the manifest entry of one image: the input
+    is unchanged and every recorded output can still be read.
+    """
+    img_path, entry, output_dir = job
+    if not os.path.exists(img_path):
+        return ["input removed"]
+    problems = []
+    if file_hash(img_path) != entry["hash"]:
+        problems.append("input changed since it was transformed")
+    for name in entry["transformations"]:
+        if name not in entry["outputs"]:
+            problems.append(f"{name}: no output recorded")
+            continue
+        output_path = os.path.join(output_dir, entry["outputs"][name])
+        if not os.path.exists(output_path):
+            problems.append(f"{name}: {output_path} is missing")
+        elif cv2.imread(output_path) is None:
+            problems.append(f"{name}: {output_path} cannot be read")
+    return problems
+
+
+def output_settings():
+    """
+    This function returns the settings of the current process changing
+    the outputs, recorded in the manifest: the outputs made with other
+    settings are done again.
+    """
+    segmentation = segmentation_settings()
+    writer = writer_settings()
+    return {"model": segmentation["model_name"],
+            "segmentation_scale": segmentation["scale"],
+            "image_format": writer["image_format"],
+            "quality": writer["quality"]}
+
+
+def init_worker(segmentation, mask_cache, backend="plantcv", writer=()):
+    """
+    This function configures the rembg session, the mask cache,
+    the mask backend and the image writer of a process.
+    """
+    configure_segmentation(*segmentation)
+    configure_mask_cache(*mask_cache)
+    configure_backend(backend)
+    configure_writer(*writer)
+
+
+def worker_stats():
+    """
+    This function returns the rembg session and mask cache
+    statistics of the current process.
+    """
+    stats = segmentation_stats()
+    cache = get_mask_cache()
+    stats["cache_hits"] = cache.hits if cache is not None else 0
+    stats["cache_misses"] = cache.misses if cache is not None else 0
+    return stats
+
+
+def print_stats(stats_by_pid):
+    """
+    This function prints the setup time of the rembg sessions,
+    the time saved by reusing them and the mask cache usage.
+    """
+    def total(key):
+        return sum(stats[key] for stats in stats_by_pid.values())
+
+    print(f"Segmentation sessions: {total('loads')} loaded in "
+          f"{total('setup_seconds'):.2f}s, "
+          f"{total('saved_seconds'):.2f}s of setup saved by reuse.")
+    print(f"Mask cache: {total('cache_hits')} hits, "
+          f"{total('cache_misses')} misses.")
+
+
+def catalog_transformations(catalog, path, output_dir, manifest):
+    """
+    This function indexes the inputs and outputs of the manifest in
+    the catalog and records the image and transformation each output
+    came from, without listing path nor output_dir.
+    """
+    catalog.add([os.path.join(root, file)
+                 for key, entry in manifest.entries.items()
+                 for root, file in [(path, key)] + [
+                     (output_dir, output)
+                     for output in entry["outputs"].values()]])
+    catalog.record_origin([
+        (os.path.join(output_dir, output), os.path.join(path, key), name)
+        for key, entry in manifest.entries.items()
+        for name, output in entry["outputs"].items()
+    ], "transformation")
+
+
+def transformation_dir(path, output_dir, transformations, workers=1,
+                       settings=((), (), "plantcv", ()),
+                       landmarks_path=None, catalog=None):
+    """
+    This function transforms every image of a directory,
+    spreading them across workers processes.
+    Images already transformed according to the manifest of
+    output_dir are skipped, and the manifest is saved as images
+    are done so an interrupted run can be resumed.
+    The inputs and outputs are indexed in catalog if given.
+    """
+    transformations = sorted(transformations) if len(transformations) > 0 \
+        else DEFAULT_OUTPUTS
+    manifest = Manifest(output_dir)
+    jobs = [(img_path, basename, transformations,
+             manifest.entries.get(os.path.relpath(img_path, path)),
+             output_dir, landmarks_path is not None)
+            for img_path, basename in list_images(path, output_dir)]
+    for job in jobs:
+        os.makedirs(os.path.dirname(job[1]), exist_ok=True)
+
+    count = 0
+    failed = 0
+    skipped = 0
+    stats_by_pid = dict()
+    landmarks_by_name = dict()
+    last_save = time.monotonic()
+    try:
+        for job, result, error in run_jobs(transformation_file, jobs,
+                                           workers, init_worker, settings):
+            count += 1
+            if error is not None:
+                failed += 1
+                print(f"\nFailed {job[0]}: {str(error)}", file=sys.stderr)
+            else:
+                input_hash, outputs, landmarks, run_settings, stats = result
+                stats_by_pid[stats["pid"]] = stats
+                if landmarks is not None:
+                    landmarks_by_name[os.path.relpath(job[0], path)] = \
+                        landmarks
+                if len(outputs) == 0:
+                    skipped += 1
+                manifest.record(os.path.relpath(job[0], path), input_hash,
+                                transformations, outputs, run_settings)
+                if time.monotonic() - last_save > 10:
+                    manifest.save()
+                    last_save = time.monotonic()
+            print_progress(count, len(jobs), failed)
+    finally:
+        manifest.save()
+    print(f"\nTransformed {count - failed - skipped}/{len(jobs)} images, "
+          f"{skipped} already up to date.")
+    print_stats(stats_by_pid)
+    if landmarks_path is not None:
+        save_landmarks(landmarks_path, landmarks_by_name)
+        print(f"Saved the pseudolandmarks of {len(landmarks_by_name)} "
+              f"images to {landmarks_path}")
+    if catalog is not None:
+        catalog_transformations(catalog, path, output_dir, manifest)
+
+
+def transformation_shards(path, shards_dir, transformations, workers=1,
+                          settings=((), (), "plantcv", ())):
+    """
+    This function transforms every image of a directory and packs
+    the outputs into the shards of shards_dir, one variant per
+    transformation, labelled with the directory of the image.
+    The outputs are packed in the order of the images, so the same
+    images give the same shards whatever order the workers finish in.
+    """
+    transformations = sorted(transformations) if len(transformations) > 0 \
+        else DEFAULT_OUTPUTS
+    jobs = [(img_path, transformations)
+            for img_path, _ in list_images(path, shards_dir)]
+
+    count = 0
+    failed = 0
+    stats_by_pid = dict()
+    done = dict()
+    next_index = 0
+    indices = {job[0]: index for index, job in enumerate(jobs)}
+    with ShardWriter(shards_dir) as writer:
+        for job, result, error in run_jobs(shard_file, jobs, workers,
+                                           init_worker, settings):
+            count += 1
+            outputs = None
+            if error is not None:
+                failed += 1
+                print(f"\nFailed {job[0]}: {str(error)}", file=sys.stderr)
+            else:
+                outputs, stats = result
+                stats_by_pid[stats["pid"]] = stats
+            done[indices[job[0]]] = outputs
+            while next_index in done:
+                outputs = done.pop(next_index)
+                img_path = jobs[next_index][0]
+                next_index += 1
+                if outputs is None:
+                    continue
+                image_id = os.path.splitext(
+                    os.path.relpath(img_path, path))[0]
+                label = os.path.basename(os.path.dirname(img_path))
+                for name in transformations:
+                    writer.write(image_id, label, name, outputs[name])
+            print_progress(count, len(jobs), failed)
+    print(f"\nPacked {writer.count} outputs of {count - failed}/{len(jobs)} "
+          f"images into {shards_dir}")
+    print_stats(stats_by_pid)
+
+
+def verify_dir(path, output_dir, workers=1):
+    """
+    This function checks the outputs recorded in the manifest of
+    output_dir against the images of path, without transforming them.
+    """
+    manifest = Manifest(output_dir)
+    images = [img_path for img_path, _ in list_images(path, output_dir)]
+    keys = {os.path.relpath(img_path, path) for img_path in images}
+    jobs = [(os.path.join(path, key), entry, output_dir)
+            for key, entry in manifest.entries.items()]
 
-                count += 1
-                print(f"{count} {count / 16}%", end="\r")
+    problems = 0
+    for key in sorted(keys - manifest.entries.keys()):
+        problems += 1
+        print(f"{key}: not transformed yet")
+    for job, result, error in run_jobs(verify_file, jobs, workers):
+        key = os.path.relpath(job[0], path)
+        if error is not None:
+            result = [str(error)]
+        for problem in result:
+            print(f"{key}: {problem}")
+        problems += len(result)
+    print(f"Verified {len(jobs)} images: {problems} problems.")
+    if problems > 0:
+        raise AssertionError(f"{problems} problems found in {output_dir}.")
 
 
 def main():
     args, transformations = arguments_logic()
+    settings = ((args.model, args.onnx_threads, args.segmentation_scale),
+                (args.cache_dir, args.cache_size * 1024 * 1024,
+                 not args.no_cache),
+                args.backend,
+                (args.writer_threads, None, args.image_format, args.quality))
 
-    if os.path.isdir(args.src):
+    if args.verify:
+        verify_dir(args.src, args.dst, args.workers)
+    elif os.path.isdir(args.src) and args.shards is not None:
+        transformation_shards(args.src, args.shards, transformations,
+                              args.workers, settings)
+    elif os.path.isdir(args.src):
         if not os.path.exists(args.dst):
             os.makedirs(args.dst)
-        transformation_dir(args.src, args.dst, transformations)
+        catalog = Catalog(args.catalog) if args.catalog is not None \
+            else None
+        try:
+            transformation_dir(args.src, args.dst, transformations,
+                               args.workers, settings, args.landmarks,
+                               catalog)
+        finally:
+            if catalog is not None:
+                catalog.close()
     else:
+        init_worker(*settings)
         transformation(
             args.src, args.dst, "plot", transformations)
 
@@ -1,3 +1,12 @@
-from .augmentation import augmentation, save_images, augmentation_from_img
+from .augmentation import (augmentation, save_images, augmentation_from_img,
+                           AUGMENTATION_NAMES)
+from .batch import (shear_batch, flip_batch, crop_batch, contrast_batch,
+                    blur_batch, augmentation_batch)
+from .planner import plan_balance, save_plan, load_plan, print_plan
+from .pipeline import AugmentationPipeline
 
-__all__ = ["augmentation", "save_images", "augmentation_from_img"]
+__all__ = ["augmentation", "save_images", "augmentation_from_img",
+           "AUGMENTATION_NAMES", "shear_batch", "flip_batch", "crop_batch",
+           "contrast_batch", "blur_batch", "augmentation_batch",
+           "plan_balance", "save_plan", "load_plan", "print_plan",
+           "AugmentationPipeline"]
@@ -4,17 +4,52 @@ from PIL import ImageEnhance
 import random
 import os
 import numpy as np
+from .homography import warp_quad
+
+
+def random_angle(rng=random):
+    """
+    Draw a rotation angle between 15 and 45 degrees either way.
+    """
+    return rng.choice([rng.randint(15, 45), rng.randint(-45, -15)])
+
+
+def random_quad(w, h, shear_factor=0.25, rng=random):
+    """
+    Draw the corners a w x h image is sheared onto, each moved inwards
+    by up to shear_factor of the image size.
+    """
+    return np.float64([
+        [rng.randint(0, int(w * shear_factor)),
+         rng.randint(0, int(h * shear_factor))],
+        [w - rng.randint(0, int(w * shear_factor)),
+         rng.randint(0, int(h * shear_factor))],
+        [w - rng.randint(0, int(w * shear_factor)), h -
+         rng.randint(0, int(h * shear_factor))],
+        [rng.randint(0, int(w * shear_factor)), h -
+         rng.randint(0, int(h * shear_factor))],
+    ])
+
+
+def crop_box(width, height, crop_fraction=0.8):
+    """
+    Return the (left, top, right, bottom) box of the centered crop.
+    """
+    new_width = int(width * crop_fraction)
+    new_height = int(height * crop_fraction)
+    left = (width - new_width) // 2
+    top = (height - new_height) // 2
+    return left, top, left + new_width, top + new_height
 
 
 class ImgTransformation():
     @staticmethod
-    def rotate(image: ImageFile, angle=None):
+    def rotate(image: ImageFile, angle=None, rng=random):
         """
-        Rotate the image by a given angle.
+        Rotate the image by a given angle, drawn from rng if not given.
         """
         if angle is None:
-            angle = random.choice(
-                [random.randint(15, 45), random.randint(-45, -15)])
+            angle = random_angle(rng)
         return image.rotate(angle)
 
     @staticmethod
@@ -29,12 +64,7 @@ class ImgTransformation():
         """
         Crop the image to the given box.
         """
-        width, height = image.size
-        new_width = int(width * crop_fraction)
-        new_height = int(height * crop_fraction)
-        left = (width - new_width) // 2
-        top = (height - new_height) // 2
-        return image.crop((left, top, left + new_width, top + new_height))
+        return image.crop(crop_box(*image.size, crop_fraction))
 
     @staticmethod
     def blur(image: ImageFile, blur_radius=2):
@@ -52,59 +82,24 @@ class ImgTransformation():
         return enhancer.enhance(contrast_factor)
 
     @staticmethod
-    def shear(image: ImageFile, shear_factor=0.25):
+    def shear(image: ImageFile, shear_factor=0.25, rng=random):
         """
         Shear the image by a given angle while maintaining the original width.
+        The corners are moved by random amounts drawn from rng.
         """
         w, h = image.size
-        # Source coordinates (original image corners)
-        src = np.float32([
-            [0, 0],
-            [w, 0],
-            [w, h],
-            [0, h]
-        ])
-
         # Destination coordinates - randomly generated
         # to create a shearing effect
-        # Adjust these values for more/less perspective
-
-        dst = np.float32([
-            [random.randint(0, int(w * shear_factor)),
-             random.randint(0, int(h * shear_factor))],
-            [w - random.randint(0, int(w * shear_factor)),
-             random.randint(0, int(h * shear_factor))],
-            [w - random.randint(0, int(w * shear_factor)), h -
-             random.randint(0, int(h * shear_factor))],
-            [random.randint(0, int(w * shear_factor)), h -
-             random.randint(0, int(h * shear_factor))],
-        ])
-
-        def find_coeffs(pa, pb):
-            matrix = []
-            for p1, p2 in zip(pa, pb):
-                matrix.append([p1[0], p1[1], 1, 0, 0, 0, -
-                              p2[0]*p1[0], -p2[0]*p1[1]])
-                matrix.append([0, 0, 0, p1[0], p1[1], 1, -
-                              p2[1]*p1[0], -p2[1]*p1[1]])
-
-            A = np.matrix(matrix)
-            B = np.array(pb).reshape(8)
-
-            res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
-            return np.array(res).reshape(8)
-
-        matrix = find_coeffs(dst, src)
+        dst = random_quad(w, h, shear_factor, rng)
 
         # Apply perspective transformation
-        img = image.transform(
-            (w, h),
-            Image.PERSPECTIVE,
-            matrix,
-            resample=Image.BICUBIC
-        )
+        return Image.fromarray(warp_quad(np.asarray(image), dst))
 
-        return img
+
+# Transformations in the order they are applied, and those drawing
+# random parameters
+AUGMENTATION_NAMES = ["rotate", "flip", "crop", "blur", "contrast", "shear"]
+RANDOM_TRANSFORMATIONS = ["rotate", "shear"]
 
 
 def save_images(images):
@@ -116,7 +111,7 @@ def save_images(images):
         print(f"Saved images to {path}")
 
 
-def augmentation(path, save_in_local_folder=False, skip={}):
+def augmentation(path, save_in_local_folder=False, skip={}, rng=random):
     """_summary_
     Augment images in the given path using OpenCV.
     This function applies various transformations to the images
@@ -125,17 +120,15 @@ def augmentation(path, save_in_local_folder=False, skip={}):
     Args:
         path (_type_): img file path
         to be augmented
+        rng: random.Random drawing the random parameters, the global
+        random module by default
     """
 
     img = Image.open(path)
-    names = [
-        "rotate",
-        "flip",
-        "crop",
-        "blur",
-        "contrast",
-        "shear"
-    ]
+    if img.mode != "RGB":
+        # PNG sources may have an alpha channel, the outputs are JPEG
+        img = img.convert("RGB")
+    names = list(AUGMENTATION_NAMES)
     transformations = [
         ImgTransformation.rotate,
         ImgTransformation.flip,
@@ -144,24 +137,20 @@ def augmentation(path, save_in_local_folder=False, skip={}):
         ImgTransformation.contrast,
         ImgTransformation.shear
     ]
-    if skip.get("crop", None) is True:
-        names.remove("crop")
-        transformations.remove(ImgTransformation.crop)
-    if skip.get("shear", None) is True:
-        names.remove("shear")
-        transformations.remove(ImgTransformation.shear)
-    if skip.get("blur", None) is True:
-        names.remove("blur")
-        transformations.remove(ImgTransformation.blur)
-    if skip.get("flip", None) is True:
-        names.remove("flip")
-        transformations.remove(ImgTransformation.flip)
+    for name in AUGMENTATION_NAMES:
+        if skip.get(name, None) is True:
+            transformations.remove(getattr(ImgTransformation, name))
+            names.remove(name)
     images = []
     for transformation, name in zip(transformations, names):
-        new_img = transformation(img)
-        output_path = "{0}_{1}.JPG".format(path[:-4] if save_in_local_folder
-                                           else os.path.basename(path)[:-4],
-                                           name)
+        if name in RANDOM_TRANSFORMATIONS:
+            new_img = transformation(img, rng=rng)
+        else:
+            new_img = transformation(img)
+        output_path = "{0}_{1}.JPG".format(
+            os.path.splitext(path if save_in_local_folder
+                             else os.path.basename(path))[0],
+            name)
         images.append((output_path, new_img))
 
     return images
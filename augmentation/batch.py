@@ -0,0 +1,177 @@
+import cv2
+import numpy as np
+from .homography import quad_warp_matrix, warp_perspective
+
+
+def _check_batch(images):
+    images = np.asarray(images)
+    if images.ndim != 4 or images.shape[-1] != 3 or \
+            images.dtype != np.uint8:
+        raise ValueError("images must be an (N, H, W, 3) uint8 array.")
+    return images
+
+
+def flip_batch(images, probability=0.5, rng=None):
+    """
+    Flip horizontally each image of an (N, H, W, 3) batch
+    with the given probability.
+    """
+    images = _check_batch(images)
+    if rng is None:
+        rng = np.random.default_rng()
+    flipped = rng.random(len(images)) < probability
+    out = images.copy()
+    out[flipped] = images[flipped, :, ::-1]
+    return out
+
+
+def crop_batch(images, fractions=(0.7, 0.9), rng=None, chunk_size=64):
+    """
+    Crop each image of an (N, H, W, 3) batch around its center, keeping
+    a fraction of its size drawn uniformly in fractions, and scale the
+    crops back to H x W with bilinear sampling.
+    The images of a chunk are stacked into one tall image and resampled
+    with a single cv2.remap; the sampling coordinates are clipped to
+    each image so no pixel leaks from its neighbour.
+    """
+    images = _check_batch(images)
+    if rng is None:
+        rng = np.random.default_rng()
+    n, h, w, _ = images.shape
+    fraction = rng.uniform(*fractions, size=n).astype(np.float32)
+
+    def coordinates(size, fraction):
+        # Source coordinate of each output pixel center, per image
+        centers = (np.arange(size, dtype=np.float32) + 0.5) / size - 0.5
+        coords = size / 2 + centers[None] * (size * fraction[:, None]) - 0.5
+        return np.clip(coords, 0, size - 1)
+
+    out = np.empty_like(images)
+    for start in range(0, n, chunk_size):
+        part = fraction[start:start + chunk_size]
+        count = len(part)
+        offsets = (np.arange(count, dtype=np.float32) * h)[:, None]
+        map_y = coordinates(h, part) + offsets
+        map_x = coordinates(w, part)
+        map_y = np.broadcast_to(map_y[:, :, None], (count, h, w))
+        map_x = np.broadcast_to(map_x[:, None, :], (count, h, w))
+        tall = images[start:start + count].reshape(count * h, w, 3)
+        cv2.remap(tall, map_x.reshape(count * h, w),
+                  map_y.reshape(count * h, w), cv2.INTER_LINEAR,
+                  dst=out[start:start + count].reshape(count * h, w, 3))
+    return out
+
+
+def contrast_tables(mean, factor):
+    """
+    Return the 256 entries lookup tables of the contrast blends of
+    means by factors, computed as PIL Image.blend does: in float32,
+    then clipped and truncated.
+    """
+    mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1)
+    factor = np.asarray(factor, dtype=np.float32).reshape(-1, 1)
+    levels = np.arange(256, dtype=np.float32)
+    tables = mean + factor * (levels - mean)
+    return np.clip(tables, 0, 255).astype(np.uint8)
+
+
+def contrast_batch(images, factors=(0.5, 2.0), rng=None):
+    """
+    Adjust the contrast of each image of an (N, H, W, 3) RGB batch by a
+    factor drawn uniformly in factors, blending towards the mean grey
+    level of the image as PIL ImageEnhance.Contrast does.
+    The grey levels of the whole batch are computed in one call and
+    the blend of each image is a 256 entries lookup table.
+    """
+    images = _check_batch(images)
+    if rng is None:
+        rng = np.random.default_rng()
+    n, h, w, _ = images.shape
+    factor = rng.uniform(*factors, size=n)
+    gray = cv2.cvtColor(images.reshape(n * h, w, 3), cv2.COLOR_RGB2GRAY)
+    mean = np.floor(gray.reshape(n, -1).mean(axis=1) + 0.5)
+    tables = contrast_tables(mean, factor)
+    out = np.empty_like(images)
+    for index in range(n):
+        cv2.LUT(images[index], tables[index], dst=out[index])
+    return out
+
+
+def blur_batch(images, radii=(0.5, 2.5), rng=None, step=0.25):
+    """
+    Blur each image of an (N, H, W, 3) batch with a Gaussian of radius
+    drawn uniformly in radii, rounded to step. The images sharing a
+    radius are blurred in one call, stacked as a tall image with each
+    image padded by reflection so no row mixes across images.
+    """
+    images = _check_batch(images)
+    if rng is None:
+        rng = np.random.default_rng()
+    n, h, w, _ = images.shape
+    sigma = np.maximum(np.round(rng.uniform(*radii, size=n) / step) * step,
+                       step)
+    out = np.empty_like(images)
+    for value in np.unique(sigma):
+        selected = np.flatnonzero(sigma == value)
+        radius = max(1, int(np.ceil(3 * value)))
+        padded = np.pad(images[selected],
+                        ((0, 0), (radius, radius), (0, 0), (0, 0)),
+                        mode="reflect")
+        tall = padded.reshape(-1, w, 3)
+        blurred = cv2.GaussianBlur(tall, (2 * radius + 1, 2 * radius + 1),
+                                   value, borderType=cv2.BORDER_REFLECT_101)
+        out[selected] = blurred.reshape(padded.shape)[:, radius:-radius]
+    return out
+
+
+BATCH_AUGMENTATIONS = {
+    "flip": flip_batch,
+    "crop": crop_batch,
+    "contrast": contrast_batch,
+    "blur": blur_batch,
+}
+
+
+def augmentation_batch(images, rng=None):
+    """
+    Augment an (N, H, W, 3) RGB batch with each batch augmentation,
+    every image with its own random parameters.
+    Returns (name, augmented batch) pairs like augmentation_from_img.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    return [(name, augment(images, rng=rng))
+            for name, augment in BATCH_AUGMENTATIONS.items()]
+
+
+def random_quads(n, w, h, shear_factor=0.25, rng=None):
+    """
+    Return n random (4, 2) quads, each corner of the w x h image moved
+    inwards by up to shear_factor of the image size, as shear does.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+    inwards = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]])
+    high = np.array([int(w * shear_factor), int(h * shear_factor)]) + 1
+    offsets = rng.integers(0, high, size=(n, 4, 2))
+    return corners + inwards * offsets
+
+
+def shear_batch(images, shear_factor=0.25, rng=None):
+    """
+    Shear a stack of same-sized images, each with its own random
+    homography. images is an (N, H, W) or (N, H, W, C) uint8 array;
+    the homographies are all computed at once in closed form and
+    each image is warped with OpenCV.
+    """
+    images = np.asarray(images)
+    if images.ndim not in (3, 4) or images.dtype != np.uint8:
+        raise ValueError("images must be an (N, H, W[, C]) uint8 array.")
+    n, h, w = images.shape[:3]
+    matrices = quad_warp_matrix(random_quads(n, w, h, shear_factor, rng),
+                                w, h)
+    sheared = np.empty_like(images)
+    for index, (image, matrix) in enumerate(zip(images, matrices)):
+        sheared[index] = warp_perspective(image, matrix)
+    return sheared
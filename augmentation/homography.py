@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+
+
+def square_to_quad(quad):
+    """
+    Return the homographies mapping the unit square (0, 0), (1, 0),
+    (1, 1), (0, 1) to quads, in closed form (Heckbert, 1989).
+    quad is a (..., 4, 2) array, the result a (..., 3, 3) array.
+    """
+    quad = np.asarray(quad, dtype=np.float64)
+    x0, x1, x2, x3 = np.moveaxis(quad[..., 0], -1, 0)
+    y0, y1, y2, y3 = np.moveaxis(quad[..., 1], -1, 0)
+    dx1, dx2, dx3 = x1 - x2, x3 - x2, x0 - x1 + x2 - x3
+    dy1, dy2, dy3 = y1 - y2, y3 - y2, y0 - y1 + y2 - y3
+    det = dx1 * dy2 - dx2 * dy1
+    g = (dx3 * dy2 - dx2 * dy3) / det
+    h = (dx1 * dy3 - dx3 * dy1) / det
+    matrix = np.empty(quad.shape[:-2] + (3, 3))
+    matrix[..., 0, 0] = x1 - x0 + g * x1
+    matrix[..., 0, 1] = x3 - x0 + h * x3
+    matrix[..., 0, 2] = x0
+    matrix[..., 1, 0] = y1 - y0 + g * y1
+    matrix[..., 1, 1] = y3 - y0 + h * y3
+    matrix[..., 1, 2] = y0
+    matrix[..., 2, 0] = g
+    matrix[..., 2, 1] = h
+    matrix[..., 2, 2] = 1
+    return matrix
+
+
+def adjugate(matrix):
+    """
+    Return the adjugate of (..., 3, 3) matrices, their inverse up to
+    a scale factor, which is all a homography needs.
+    """
+    a, b, c = matrix[..., 0, 0], matrix[..., 0, 1], matrix[..., 0, 2]
+    d, e, f = matrix[..., 1, 0], matrix[..., 1, 1], matrix[..., 1, 2]
+    g, h, i = matrix[..., 2, 0], matrix[..., 2, 1], matrix[..., 2, 2]
+    return np.stack([
+        np.stack([e * i - f * h, c * h - b * i, b * f - c * e], -1),
+        np.stack([f * g - d * i, a * i - c * g, c * d - a * f], -1),
+        np.stack([d * h - e * g, b * g - a * h, a * e - b * d], -1),
+    ], -2)
+
+
+def perspective_matrix(src, dst):
+    """
+    Return the exact homographies mapping the 4 points of src to
+    the 4 points of dst, both (..., 4, 2) arrays, normalized so
+    their last coefficient is 1.
+    """
+    matrix = square_to_quad(dst) @ adjugate(square_to_quad(src))
+    return matrix / matrix[..., 2:, 2:]
+
+
+# PIL samples pixel centers at +0.5, OpenCV at integer coordinates
+_TO_PIL = np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+_FROM_PIL = np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+
+
+def quad_warp_matrix(quad, w, h):
+    """
+    Return the OpenCV inverse maps warping a w x h image so its corners
+    land on quad, a (..., 4, 2) array: the matrices of PIL's PERSPECTIVE
+    transform converted to OpenCV's pixel coordinates.
+    """
+    corners = np.array([[0, 0], [w, 0], [w, h], [0, h]])
+    return _FROM_PIL @ perspective_matrix(quad, corners) @ _TO_PIL
+
+
+def warp_perspective(image, matrix):
+    """
+    Return image warped by the inverse map matrix with OpenCV's
+    bicubic interpolation and a black border, like PIL's transform.
+    """
+    h, w = image.shape[:2]
+    return cv2.warpPerspective(image, matrix, (w, h),
+                               flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+def warp_quad(image, quad):
+    """
+    Return image warped so its corners land on quad, the same
+    transformation as PIL's PERSPECTIVE transform of the image onto quad.
+    """
+    h, w = image.shape[:2]
+    return warp_perspective(image, quad_warp_matrix(quad, w, h))
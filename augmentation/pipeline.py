@@ -0,0 +1,162 @@
+import random
+import cv2
+import numpy as np
+from PIL import Image
+from .augmentation import random_angle, random_quad, crop_box
+from .homography import perspective_matrix
+from .batch import contrast_tables
+
+
+# PIL puts pixel centers at +0.5, OpenCV at integer coordinates
+_TO_PIL = np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+_FROM_PIL = np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+
+
+def _translation(x, y):
+    return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+
+
+class AugmentationPipeline:
+    """
+    A chain of augmentations applied in one pass.
+    The geometric operations (rotate, flip, crop, shear, resize) are
+    folded into a single matrix and the image is resampled once; what
+    a step pushes out of its canvas is cut as the chained operations
+    would. The photometric ones (contrast, blur) then run in place on
+    the resampled buffer. Random parameters are drawn on each apply,
+    so one pipeline gives fresh augmentations every call.
+
+    pipeline = AugmentationPipeline().rotate().crop().shear().blur()
+    augmented = pipeline.apply(image)
+    """
+
+    def __init__(self, interpolation=cv2.INTER_CUBIC):
+        self.interpolation = interpolation
+        self.geometric = []
+        self.photometric = []
+
+    def rotate(self, angle=None):
+        self.geometric.append(("rotate", angle))
+        return self
+
+    def flip(self):
+        self.geometric.append(("flip", None))
+        return self
+
+    def crop(self, crop_fraction=0.8):
+        self.geometric.append(("crop", crop_fraction))
+        return self
+
+    def shear(self, shear_factor=0.25):
+        self.geometric.append(("shear", shear_factor))
+        return self
+
+    def resize(self, size):
+        """
+        Scale the result to size (width, height), e.g. back to the
+        input size after a crop.
+        """
+        self.geometric.append(("resize", size))
+        return self
+
+    def contrast(self, contrast_factor=2):
+        self.photometric.append(("contrast", contrast_factor))
+        return self
+
+    def blur(self, blur_radius=2):
+        self.photometric.append(("blur", blur_radius))
+        return self
+
+    def matrix(self, size, rng=random):
+        """
+        Return the 3x3 matrix mapping input pixels to output pixels
+        for an input of size (width, height), and the output size.
+        """
+        matrix, size, _ = self._fold(size, rng)
+        return matrix, size
+
+    def _fold(self, size, rng):
+        """
+        Fold the geometric operations into one matrix. The matrices are
+        built in PIL's continuous coordinates and converted to OpenCV's
+        pixel coordinates at the end. Also returns the canvas of every
+        intermediate step as a quad in output pixel coordinates.
+        """
+        w, h = size
+        matrix = np.eye(3)
+        canvases = []
+        for name, value in self.geometric:
+            if name == "rotate":
+                angle = random_angle(rng) if value is None else value
+                # PIL rotates counter clockwise around the center
+                step = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+                step = np.vstack([step, [0, 0, 1]])
+            elif name == "flip":
+                step = np.array([[-1, 0, w], [0, 1, 0], [0, 0, 1]],
+                                dtype=np.float64)
+            elif name == "crop":
+                left, top, right, bottom = crop_box(w, h, value)
+                step = _translation(-left, -top)
+                w, h = right - left, bottom - top
+            elif name == "shear":
+                corners = np.array([[0, 0], [w, 0], [w, h], [0, h]])
+                step = perspective_matrix(corners,
+                                          random_quad(w, h, value, rng))
+            else:
+                step = np.diag([value[0] / w, value[1] / h, 1])
+                w, h = value
+            matrix = step @ matrix
+            canvases.append((matrix, (w, h)))
+
+        clips = []
+        for canvas_matrix, (canvas_w, canvas_h) in canvases[:-1]:
+            to_output = matrix @ np.linalg.inv(canvas_matrix)
+            corners = np.array([[0, 0, 1], [canvas_w, 0, 1],
+                                [canvas_w, canvas_h, 1], [0, canvas_h, 1]])
+            quad = corners @ to_output.T
+            clips.append(quad[:, :2] / quad[:, 2:] - 0.5)
+        return _FROM_PIL @ matrix @ _TO_PIL, (w, h), clips
+
+    def apply(self, image, rng=random):
+        """
+        Return the augmented image, a PIL image if image is one,
+        an array otherwise.
+        """
+        is_pil = isinstance(image, Image.Image)
+        array = np.asarray(image)
+        matrix, size, clips = self._fold((array.shape[1], array.shape[0]),
+                                         rng)
+        if np.allclose(matrix, np.eye(3)) and \
+                size == (array.shape[1], array.shape[0]):
+            out = array.copy()
+        elif np.allclose(matrix[2], [0, 0, 1]):
+            out = cv2.warpAffine(array, matrix[:2], size,
+                                 flags=self.interpolation,
+                                 borderMode=cv2.BORDER_CONSTANT,
+                                 borderValue=0)
+        else:
+            out = cv2.warpPerspective(array, matrix, size,
+                                      flags=self.interpolation,
+                                      borderMode=cv2.BORDER_CONSTANT,
+                                      borderValue=0)
+        if len(clips) > 0:
+            mask = np.full(out.shape[:2], 255, dtype=np.uint8)
+            for quad in clips:
+                inside = np.zeros_like(mask)
+                cv2.fillConvexPoly(inside, np.round(quad * 16).astype(
+                    np.int32), 255, lineType=cv2.LINE_8, shift=4)
+                cv2.bitwise_and(mask, inside, dst=mask)
+            out[mask == 0] = 0
+
+        for name, value in self.photometric:
+            if name == "contrast":
+                # Same blend as PIL ImageEnhance.Contrast: towards the
+                # mean of the grey levels, truncated
+                gray = out if out.ndim == 2 else \
+                    cv2.cvtColor(out, cv2.COLOR_RGB2GRAY)
+                mean = int(gray.mean() + 0.5)
+                cv2.LUT(out, contrast_tables(mean, value)[0], dst=out)
+            else:
+                cv2.GaussianBlur(out, (0, 0), value, dst=out,
+                                 sigmaY=value)
+        return Image.fromarray(out) if is_pil else out
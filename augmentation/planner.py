@@ -0,0 +1,97 @@
+import json
+import os
+from distribution import distribution, IMAGE_EXTENSIONS
+from .augmentation import AUGMENTATION_NAMES
+
+
+PLAN_VERSION = 1
+
+
+def class_images(path):
+    """
+    Return the images of each class of a directory, a class being
+    the name of the directory holding the images, in sorted order.
+    These are the images distribution counts.
+    """
+    images = dict()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(IMAGE_EXTENSIONS):
+                images.setdefault(os.path.basename(root), []).append(
+                    os.path.relpath(os.path.join(root, file), path))
+    return images
+
+
+def plan_balance(path, target=None, skip={}, seed=None):
+    """
+    Plan the augmentations bringing every class of a directory to
+    target images, the size of the largest class by default.
+    The images of a class are augmented in turn, rotating through the
+    operations not skipped, so a class missing n images gets exactly
+    n augmentations spread across its images and operations.
+    A class cannot grow beyond one augmentation per image and operation.
+    seed is recorded in the plan so running it again gives the same images.
+    """
+    counts = distribution(path)
+    images = class_images(path)
+    operations = [name for name in AUGMENTATION_NAMES
+                  if skip.get(name, None) is not True]
+    if len(operations) == 0:
+        raise ValueError("Every augmentation is skipped.")
+    if target is None:
+        target = max(counts.values(), default=0)
+
+    classes = dict()
+    jobs = []
+    for label in sorted(counts):
+        sources = images.get(label, [])
+        missing = max(0, target - counts[label])
+        planned = min(missing, len(sources) * len(operations))
+        if planned < missing:
+            print(f"{label}: only {planned} of the {missing} missing images "
+                  f"can be created from {len(sources)} images.")
+        classes[label] = {"count": counts[label], "augmentations": planned}
+        by_image = [[] for _ in sources]
+        for index in range(planned):
+            image = index % len(sources)
+            turn = index // len(sources)
+            by_image[image].append(
+                operations[(image + turn) % len(operations)])
+        jobs += [{"path": source, "operations": sorted(
+                     names, key=AUGMENTATION_NAMES.index)}
+                 for source, names in zip(sources, by_image)
+                 if len(names) > 0]
+    return {
+        "version": PLAN_VERSION,
+        "source": os.path.abspath(path),
+        "target": target,
+        "seed": seed,
+        "classes": classes,
+        "jobs": jobs,
+    }
+
+
+def save_plan(plan, path):
+    """
+    Write a plan atomically as JSON.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(plan, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_plan(path):
+    with open(path, "r") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version in {path}.")
+    return plan
+
+
+def print_plan(plan):
+    print(f"Balancing to {plan['target']} images per class:")
+    for label, value in plan["classes"].items():
+        print(f"{label.ljust(20)}: {value['count']} images, "
+              f"{value['augmentations']} augmentations")
@@ -0,0 +1,75 @@
+import sys
+from utils import Argument, StaticValidators
+from benchmark import (benchmark_backends, benchmark_segmentation_scale,
+                       benchmark_shear, benchmark_augmentation_batch,
+                       benchmark_precision)
+
+
+BENCHMARKS = {
+    "backends": lambda args: benchmark_backends(
+        args.src, args.limit, args.repeat),
+    "segmentation_scale": lambda args: benchmark_segmentation_scale(
+        args.src, args.scales, args.limit),
+    "shear": lambda args: benchmark_shear(args.src, args.limit, args.repeat),
+    "augmentation_batch": lambda args: benchmark_augmentation_batch(
+        args.src, args.limit, args.repeat),
+    "precision": lambda args: benchmark_precision(
+        args.src, args.limit, args.repeat),
+}
+
+
+def arguments_logic():
+    cls = Argument("Benchmark the image pipelines on a directory of images")
+    cls.add_argument(
+        "name",
+        str,
+        f"Benchmark to run. Between {list(BENCHMARKS)}",
+    )
+    cls.add_argument(
+        "-src",
+        type=str,
+        help="Path to the directory of images",
+        default="data/"
+    )
+    cls.add_argument(
+        "--limit",
+        type=int,
+        help="Maximum number of images used",
+        default=50
+    )
+    cls.add_argument(
+        "--repeat",
+        type=int,
+        help="Number of timed runs",
+        default=3
+    )
+    cls.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        help="Segmentation scales compared to the full resolution",
+        default=[0.75, 0.5, 0.25]
+    )
+    args = cls.get_args()
+    cls.add_validator(StaticValidators.validate_path_dir, args.src)
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.limit, 1, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.repeat, 1, None))
+    cls.validate()
+    if any(not 0 < scale <= 1 for scale in args.scales):
+        raise ValueError("The scales must be in ]0, 1].")
+    if args.name not in BENCHMARKS:
+        raise ValueError(f"Invalid benchmark '{args.name}'. \
+Choose from {list(BENCHMARKS)}.")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        args = arguments_logic()
+        BENCHMARKS[args.name](args)
+        exit(0)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        exit(1)
@@ -0,0 +1,9 @@
+from .backends import benchmark_backends
+from .augmentation_batch import benchmark_augmentation_batch
+from .segmentation_scale import benchmark_segmentation_scale
+from .shear import benchmark_shear
+from .precision import benchmark_precision
+
+__all__ = ["benchmark_backends", "benchmark_segmentation_scale",
+           "benchmark_shear", "benchmark_augmentation_batch",
+           "benchmark_precision"]
@@ -0,0 +1,48 @@
+import time
+import numpy as np
+from PIL import Image
+from augmentation.augmentation import ImgTransformation
+from augmentation.batch import augmentation_batch
+from .images import load_images
+
+
+def pil_augmentations(image):
+    """
+    The flip, crop, contrast and blur augmentations of one PIL image,
+    as augmentation_from_img computes them.
+    """
+    return [
+        ("flip", ImgTransformation.flip(image)),
+        ("crop", ImgTransformation.crop(image).resize(image.size)),
+        ("contrast", ImgTransformation.contrast(image)),
+        ("blur", ImgTransformation.blur(image)),
+    ]
+
+
+def benchmark_augmentation_batch(path, limit=50, repeat=3):
+    """
+    Time the PIL augmentations image by image against augmentation_batch
+    on the same images stacked into one (N, H, W, 3) array.
+    """
+    arrays = load_images(path, limit)
+    if len({img.shape for img in arrays}) != 1:
+        raise AssertionError("augmentation_batch needs images of one size.")
+    stack = np.ascontiguousarray(np.stack(arrays)[..., ::-1])
+    images = [Image.fromarray(img) for img in stack]
+
+    timings = dict()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img in images:
+            pil_augmentations(img)
+    timings["pil"] = (time.perf_counter() - start) / (repeat * len(images))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        augmentation_batch(stack, rng=np.random.default_rng(0))
+    timings["batch"] = (time.perf_counter() - start) / (repeat * len(images))
+
+    print(f"{len(images)} images, {repeat} repeats")
+    for name, seconds in timings.items():
+        print(f"{name.ljust(6)}: {seconds * 1000:.2f} ms/image "
+              f"(x{timings['pil'] / seconds:.2f})")
+    return timings
@@ -0,0 +1,44 @@
+import time
+from rembg import remove
+from transformation.backends import BACKENDS, get_backend, check_backends
+from transformation.segmentation import get_session
+from transformation.transformation import leaf_mask
+from .images import load_images
+
+
+def _mask_pipeline(backend, img, removed):
+    filled = leaf_mask(img, removed, backend.name)
+    disease_mask = backend.logical_xor(filled.copy(),
+                                       backend.disease_threshold(img))
+    blur = backend.gaussian_blur(disease_mask, (3, 3))
+    return {"filled": filled, "disease_mask": disease_mask, "blur": blur}
+
+
+def benchmark_backends(path, limit=50, repeat=3):
+    """
+    Check with check_backends that every backend gives the masks of the
+    plantcv backend, then time their mask operations on the same images.
+    rembg runs once per image beforehand, it is not part of the timing.
+    """
+    check_backends()
+    print("All backends give identical masks.")
+    images = load_images(path, limit)
+    session = get_session()
+    removed = [remove(img, session=session) for img in images]
+
+    timings = dict()
+    for name in BACKENDS:
+        backend = get_backend(name)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for img, cut in zip(images, removed):
+                _mask_pipeline(backend, img, cut)
+        timings[name] = (time.perf_counter() - start) / \
+            (repeat * len(images))
+
+    print(f"{len(images)} images, {repeat} repeats")
+    for name, seconds in timings.items():
+        speedup = timings["plantcv"] / seconds
+        print(f"{name.ljust(10)}: {seconds * 1000:.2f} ms/image "
+              f"(x{speedup:.2f})")
+    return timings
@@ -0,0 +1,24 @@
+import os
+import cv2
+
+
+def load_images(path, limit=None):
+    """
+    Load up to limit images of a directory (recursively) as BGR arrays,
+    in a stable order.
+    """
+    allowed_extensions = (".jpg", ".JPG", ".jpeg", ".png")
+    images = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith(allowed_extensions):
+                continue
+            img = cv2.imread(os.path.join(root, file))
+            if img is not None:
+                images.append(img)
+            if limit is not None and len(images) >= limit:
+                return images
+    if len(images) == 0:
+        raise AssertionError(f"No image found in {path}.")
+    return images
@@ -0,0 +1,104 @@
+import time
+import numpy as np
+import keras
+from storage.tensors import list_class_images, load_image
+from train.train import create_model
+from utils.precision import configure_precision
+
+
+# (precision, XLA) of the modes compared
+MODES = (
+    ("float32", False),
+    ("float32", True),
+    ("mixed_bfloat16", False),
+    ("mixed_bfloat16", True),
+)
+
+
+def load_labelled_images(path, limit=None, image_size=(128, 128)):
+    """
+    Load up to limit random images of a directory of class folders as
+    float32 arrays with their labels, split into train and validation.
+    """
+    class_names, images = list_class_images(path)
+    if len(images) < 2:
+        raise AssertionError(f"Not enough images found in {path}.")
+    order = np.random.RandomState(42).permutation(len(images))[:limit]
+    x = np.stack([load_image((images[i][0], image_size))
+                  for i in order]).astype(np.float32)
+    y = np.array([images[i][1] for i in order], dtype=np.int32)
+    nb_val = max(1, int(0.2 * len(order)))
+    return class_names, (x[nb_val:], y[nb_val:]), (x[:nb_val], y[:nb_val])
+
+
+def benchmark_mode(precision, jit, class_names, train, val, repeat=3,
+                   batch_size=32):
+    """
+    Train create_model from the same initial weights in one mode for
+    1 + repeat epochs and time its training and inference. The first
+    epoch and the first prediction trace and compile the steps and are
+    timed apart.
+    """
+    keras.backend.clear_session()
+    keras.utils.set_random_seed(42)
+    model = create_model(len(class_names), 48, 0.3,
+                         jit_compile=True if jit else "auto")
+    x_train, y_train = train
+    x_val, y_val = val
+
+    epochs = []
+    for _ in range(1 + repeat):
+        start = time.perf_counter()
+        model.fit(x_train, y_train, batch_size=batch_size, epochs=1,
+                  verbose=0)
+        epochs.append(time.perf_counter() - start)
+    _, accuracy = model.evaluate(x_val, y_val, batch_size=batch_size,
+                                 verbose=0)
+
+    x = np.concatenate([x_train, x_val])
+    model.predict(x, batch_size=batch_size, verbose=0)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        model.predict(x, batch_size=batch_size, verbose=0)
+    predict_seconds = time.perf_counter() - start
+    return {
+        "first_epoch": epochs[0],
+        "train": len(x_train) * repeat / sum(epochs[1:]),
+        "predict": len(x) * repeat / predict_seconds,
+        "accuracy": accuracy,
+    }
+
+
+def benchmark_precision(path, limit=50, repeat=3):
+    """
+    Compare the training and inference throughput (images per second)
+    and validation accuracy of create_model in float32 and
+    mixed_bfloat16, with and without XLA, on the same images.
+    The bfloat16 modes are skipped on CPUs without bfloat16 instructions.
+    """
+    class_names, train, val = load_labelled_images(path, limit)
+    results = dict()
+    try:
+        for precision, jit in MODES:
+            name = f"{precision}{' + XLA' if jit else ''}"
+            if configure_precision(precision) != precision:
+                print(f"{name}: skipped")
+                continue
+            results[name] = benchmark_mode(precision, jit, class_names,
+                                           train, val, repeat)
+    finally:
+        configure_precision("float32")
+
+    print(f"{len(train[0])} training and {len(val[0])} validation images, "
+          f"{repeat} repeats")
+    print(f"{'mode'.ljust(24)}{'train img/s'.rjust(12)}"
+          f"{'1st epoch s'.rjust(12)}{'predict img/s'.rjust(15)}"
+          f"{'val acc'.rjust(9)}")
+    reference = next(iter(results.values()))
+    for name, result in results.items():
+        print(f"{name.ljust(24)}{result['train']:12.1f}"
+              f"{result['first_epoch']:12.2f}{result['predict']:15.1f}"
+              f"{result['accuracy']:9.3f}"
+              f"  (train x{result['train'] / reference['train']:.2f}, "
+              f"predict x{result['predict'] / reference['predict']:.2f})")
+    return results
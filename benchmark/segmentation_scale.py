@@ -0,0 +1,45 @@
+import time
+import numpy as np
+from transformation.segmentation import get_session
+from transformation.transformation import remove_background_rembg
+from .images import load_images
+
+
+def mask_iou(reference, mask):
+    """
+    Return the intersection over union of two binary masks.
+    """
+    reference = reference > 0
+    mask = mask > 0
+    union = np.logical_or(reference, mask).sum()
+    if union == 0:
+        return 1.0
+    return np.logical_and(reference, mask).sum() / union
+
+
+def benchmark_segmentation_scale(path, scales=(0.75, 0.5, 0.25), limit=50):
+    """
+    Time the background removal at full resolution and at each scale,
+    and compare the upsampled masks to the full resolution ones.
+    """
+    images = load_images(path, limit)
+    session = get_session()
+    remove_background_rembg(images[0], session)
+
+    timings = dict()
+    masks = dict()
+    for scale in [1.0] + [scale for scale in scales if scale != 1]:
+        start = time.perf_counter()
+        masks[scale] = [remove_background_rembg(img, session,
+                                                segmentation_scale=scale)
+                        for img in images]
+        timings[scale] = (time.perf_counter() - start) / len(images)
+
+    print(f"{len(images)} images")
+    for scale, seconds in timings.items():
+        ious = [mask_iou(reference, mask)
+                for reference, mask in zip(masks[1.0], masks[scale])]
+        print(f"scale {scale:<5}: {seconds * 1000:.2f} ms/image "
+              f"(x{timings[1.0] / seconds:.2f}), "
+              f"IoU mean {np.mean(ious):.4f} min {np.min(ious):.4f}")
+    return timings
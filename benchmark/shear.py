@@ -0,0 +1,86 @@
+import random
+import time
+import numpy as np
+from PIL import Image
+from augmentation.augmentation import ImgTransformation
+from augmentation.batch import shear_batch
+from .images import load_images
+
+
+def legacy_shear(image, shear_factor=0.25, rng=random):
+    """
+    The shear augmentation as it was implemented before: a least squares
+    solve of the 8x8 system with np.matrix and PIL's bicubic transform.
+    """
+    w, h = image.size
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([
+        [rng.randint(0, int(w * shear_factor)),
+         rng.randint(0, int(h * shear_factor))],
+        [w - rng.randint(0, int(w * shear_factor)),
+         rng.randint(0, int(h * shear_factor))],
+        [w - rng.randint(0, int(w * shear_factor)), h -
+         rng.randint(0, int(h * shear_factor))],
+        [rng.randint(0, int(w * shear_factor)), h -
+         rng.randint(0, int(h * shear_factor))],
+    ])
+
+    def find_coeffs(pa, pb):
+        matrix = []
+        for p1, p2 in zip(pa, pb):
+            matrix.append([p1[0], p1[1], 1, 0, 0, 0, -
+                          p2[0]*p1[0], -p2[0]*p1[1]])
+            matrix.append([0, 0, 0, p1[0], p1[1], 1, -
+                          p2[1]*p1[0], -p2[1]*p1[1]])
+
+        A = np.matrix(matrix)
+        B = np.array(pb).reshape(8)
+
+        res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
+        return np.array(res).reshape(8)
+
+    return image.transform((w, h), Image.PERSPECTIVE, find_coeffs(dst, src),
+                           resample=Image.BICUBIC)
+
+
+def benchmark_shear(path, limit=50, repeat=3):
+    """
+    Time the legacy shear, the closed-form shear and shear_batch on the
+    same images, and compare the closed-form images to the legacy ones
+    drawn with the same random corners.
+    """
+    arrays = load_images(path, limit)
+    images = [Image.fromarray(img[..., ::-1]) for img in arrays]
+
+    timings = dict()
+    outputs = dict()
+    for name, shear in (("legacy", legacy_shear),
+                        ("closed-form", ImgTransformation.shear)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            rng = random.Random(0)
+            outputs[name] = [np.asarray(shear(img, rng=rng))
+                             for img in images]
+        timings[name] = (time.perf_counter() - start) / \
+            (repeat * len(images))
+
+    shapes = {img.shape for img in arrays}
+    if len(shapes) == 1:
+        stack = np.stack([np.asarray(img) for img in images])
+        start = time.perf_counter()
+        for _ in range(repeat):
+            shear_batch(stack, rng=np.random.default_rng(0))
+        timings["batch"] = (time.perf_counter() - start) / \
+            (repeat * len(images))
+    else:
+        print("Images of different sizes, shear_batch is not timed.")
+
+    print(f"{len(images)} images, {repeat} repeats")
+    for name, seconds in timings.items():
+        print(f"{name.ljust(12)}: {seconds * 1000:.2f} ms/image "
+              f"(x{timings['legacy'] / seconds:.2f})")
+    diff = [np.abs(legacy.astype(np.int16) - new).mean()
+            for legacy, new in zip(outputs["legacy"], outputs["closed-form"])]
+    print(f"Mean absolute difference with the legacy shear: "
+          f"{np.mean(diff):.3f} (max {np.max(diff):.3f}) on a 0-255 scale")
+    return timings
@@ -0,0 +1,66 @@
+import os
+import sys
+from utils import Argument, StaticValidators
+from storage import compile_dataset
+from train.pipeline import split_files
+
+
+def arguments_logic():
+    cls = Argument(
+        "Decode the images of each dataset variant once into a \
+memory-mapped store read by train.py")
+    cls.add_argument(
+        "-src",
+        type=str,
+        help="Path to the dataset directory holding one folder per variant",
+        default="dataset"
+    )
+    cls.add_argument(
+        "-dst",
+        type=str,
+        help="Path to the directory of the compiled variants",
+        default="dataset_compiled"
+    )
+    cls.add_argument(
+        "--variants",
+        type=str,
+        nargs="+",
+        help="Variants to compile",
+        default=["original", "mask", "no_bg"]
+    )
+    cls.add_argument(
+        "--size",
+        type=int,
+        help="Height and width the images are resized to",
+        default=128
+    )
+    cls.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes decoding the images",
+        default=1
+    )
+    args = cls.get_args()
+    cls.add_validator(StaticValidators.validate_path_dir, args.src)
+    for variant in args.variants:
+        cls.add_validator(StaticValidators.validate_path_dir,
+                          os.path.join(args.src, variant))
+    cls.add_validator(StaticValidators.validate_number, (args.size, 1, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.workers, 1, None))
+    cls.validate()
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        args = arguments_logic()
+        for variant in args.variants:
+            path = os.path.join(args.src, variant)
+            compile_dataset(path, os.path.join(args.dst, variant),
+                            split_files(path), (args.size, args.size),
+                            workers=args.workers)
+        exit(0)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        exit(1)
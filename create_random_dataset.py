@@ -1,26 +1,152 @@
 import os
 import sys
+import errno
+import fcntl
+import hashlib
+import heapq
 import random
 import shutil
 from utils import Argument, StaticValidators
+from storage import Catalog
 
 
-def create_random_dataset(source_dir, output_dir, images_per_class=10):
+LINK_MODES = ("copy", "hardlink", "symlink", "reflink")
+# ioctl cloning a whole file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def link_file(source_path, dest_path, mode="copy"):
+    """
+    Create dest_path from source_path without duplicating its bytes:
+    a hard link, a symbolic link to the absolute source path or a
+    copy-on-write clone (reflink), or a plain copy with mode 'copy'.
+    An existing dest_path is replaced.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"Unknown link mode '{mode}'. \
+Choose from {list(LINK_MODES)}.")
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    if mode == "copy":
+        shutil.copy2(source_path, dest_path)
+    elif mode == "hardlink":
+        try:
+            os.link(source_path, dest_path)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                raise AssertionError("Cannot hardlink across filesystems, \
+use --link-mode symlink or copy.")
+            raise
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(source_path), dest_path)
+    else:
+        with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError as e:
+                dst.close()
+                os.remove(dest_path)
+                if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                               errno.EINVAL):
+                    raise AssertionError("The filesystem cannot reflink \
+these files, use --link-mode hardlink or copy.")
+                raise
+        shutil.copystat(source_path, dest_path)
+
+
+def sample_priority(seed, name):
+    """
+    Return the random priority of a file for a seed: the images with
+    the lowest priorities are selected.
+    """
+    digest = hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+def sample_images(class_path, count, seed):
+    """
+    Select count random images of a class folder in one streaming pass
+    over os.scandir, holding at most count names in memory.
+    Each image gets a priority derived from the seed and its name and
+    the count lowest are kept, so the selection does not depend on
+    the order the folder is listed in.
+    """
+    # Max-heap of the lowest priorities seen so far
+    reservoir = []
+    with os.scandir(class_path) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(
+                    ('.jpg', '.jpeg', '.png', '.JPG')) or \
+                    not entry.is_file():
+                continue
+            priority = sample_priority(seed, entry.name)
+            if len(reservoir) < count:
+                heapq.heappush(reservoir, (-priority, entry.name))
+            elif priority < -reservoir[0][0]:
+                heapq.heapreplace(reservoir, (-priority, entry.name))
+    return [name for _, name in sorted(reservoir, reverse=True)]
+
+
+def add_image(source_path, output_dir, class_folder, index, link_mode):
+    """
+    Add one selected image to the dataset as folderName_number.ext.
+    """
+    _, ext = os.path.splitext(source_path)
+    if not ext:
+        ext = ".JPG"  # Default extension if none is found
+    new_filename = f"{class_folder}_{index + 1}{ext}"
+    link_file(source_path, os.path.join(output_dir, new_filename), link_mode)
+    print(f"  {link_mode.capitalize()}: {os.path.basename(source_path)} → "
+          f"{new_filename}")
+
+
+def create_random_dataset_from_catalog(catalog, source_dir, output_dir,
+                                       images_per_class=10, seed=None,
+                                       link_mode="copy", refresh=False):
+    """
+    Create a new dataset by randomly selecting images of each class
+    recorded in the dataset catalog under source_dir, without listing
+    any folder. With refresh, source_dir is indexed again first.
+    """
+    if refresh:
+        catalog.update(source_dir)
+    samples = catalog.sample(source_dir, images_per_class, seed,
+                             origin="original")
+    if len(samples) == 0:
+        raise AssertionError(f"No original images of {source_dir} in the \
+catalog, index them with --refresh_catalog.")
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Found {len(samples)} classes: {sorted(samples)}")
+
+    total_copied = 0
+    for label in sorted(samples):
+        for i, source_path in enumerate(samples[label]):
+            add_image(source_path, output_dir, label, i, link_mode)
+            total_copied += 1
+
+    print(f"\nSummary: Added {total_copied} images to {output_dir}")
+
+
+def create_random_dataset(source_dir, output_dir, images_per_class=10,
+                          seed=None, link_mode="copy"):
     """
     Create a new dataset by randomly selecting images from each class folder.
 
     Args:
         source_dir: Path to the source directory containing class folders
         output_dir: Path to the output directory
-                    where random images will be copied
+                    where random images will be added
         images_per_class: Number of random images to select from each class
+        seed: Seed of the selection, the same seed selects the same images
+        link_mode: How images are added, between LINK_MODES
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
 
     # Get list of class folders
-    class_folders = [f for f in os.listdir(source_dir)
-                     if os.path.isdir(os.path.join(source_dir, f))]
+    with os.scandir(source_dir) as entries:
+        class_folders = sorted(entry.name for entry in entries
+                               if entry.is_dir())
 
     print(f"Found {len(class_folders)} class folders: {class_folders}")
 
@@ -30,41 +156,22 @@ def create_random_dataset(source_dir, output_dir, images_per_class=10):
     for class_folder in class_folders:
         class_path = os.path.join(source_dir, class_folder)
 
-        # Get all image files in the class folder
-        image_files = [f for f in os.listdir(class_path)
-                       if f.lower().endswith(('.jpg',
-                                              '.jpeg', '.png', '.JPG'))]
-
-        num_to_select = min(len(image_files), images_per_class)
+        # Randomly select images without listing the whole folder
+        selected_images = sample_images(class_path, images_per_class, seed)
 
-        if num_to_select == 0:
+        if len(selected_images) == 0:
             print(f"No images found in {class_folder}, skipping")
             continue
 
-        print(f"Selecting {num_to_select} random images from {class_folder}")
-
-        # Randomly select images
-        selected_images = random.sample(image_files, num_to_select)
+        print(f"Selecting {len(selected_images)} random images "
+              f"from {class_folder}")
 
-        # Copy and rename each selected image
         for i, image_file in enumerate(selected_images):
-            source_path = os.path.join(class_path, image_file)
-
-            # Get file extension from original file
-            _, ext = os.path.splitext(image_file)
-            if not ext:
-                ext = ".JPG"  # Default extension if none is found
-
-            # Create new filename with the pattern folderName_number.JPG
-            new_filename = f"{class_folder}_{i+1}{ext}"
-            dest_path = os.path.join(output_dir, new_filename)
-
-            # Copy the file
-            shutil.copy2(source_path, dest_path)
-            print(f"  Copied: {image_file} → {new_filename}")
+            add_image(os.path.join(class_path, image_file), output_dir,
+                      class_folder, i, link_mode)
             total_copied += 1
 
-    print(f"\nSummary: Copied {total_copied} images to {output_dir}")
+    print(f"\nSummary: Added {total_copied} images to {output_dir}")
 
 
 def arguments_logic():
@@ -75,18 +182,41 @@ def arguments_logic():
                      help="Output directory for the random dataset")
     cls.add_argument("--count", type=int, default=10,
                      help="Number of random images to select from each class")
+    cls.add_argument("--catalog", type=str,
+                     help="Sample the images from this dataset catalog")
+    cls.add_argument("--refresh_catalog", action="store_true",
+                     help="Index the source directory again in the \
+catalog before sampling it")
+    cls.add_argument("--link-mode", type=str, default="copy",
+                     help=f"How the selected images are added, between \
+{list(LINK_MODES)}. hardlink, symlink and reflink take no extra space")
+    cls.add_argument("--seed", type=int,
+                     help="Seed of the selection, \
+a run with the same seed selects the same images")
     args = cls.get_args()
     cls.add_validator(StaticValidators.validate_path_dir, args.src)
-    cls.add_validator(StaticValidators.validate_number, (args.count, 1, 200))
+    cls.add_validator(StaticValidators.validate_number, (args.count, 1, None))
     cls.validate()
+    if args.link_mode not in LINK_MODES:
+        raise ValueError(f"Unknown link mode '{args.link_mode}'. \
+Choose from {list(LINK_MODES)}.")
     return args
 
 
 if __name__ == "__main__":
     try:
         args = arguments_logic()
-        create_random_dataset(
-            args.src, args.dst, args.count)
+        if args.seed is None:
+            args.seed = random.randrange(2 ** 32)
+            print(f"Seed: {args.seed}")
+        if args.catalog is not None:
+            with Catalog(args.catalog) as catalog:
+                create_random_dataset_from_catalog(
+                    catalog, args.src, args.dst, args.count, args.seed,
+                    args.link_mode, args.refresh_catalog)
+        else:
+            create_random_dataset(
+                args.src, args.dst, args.count, args.seed, args.link_mode)
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
         exit(1)
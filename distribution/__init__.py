@@ -1,3 +1,6 @@
 from .distribution import distribution, plot_distribution
+from .scanner import (scan_images, load_index, save_index,
+                      IMAGE_EXTENSIONS, DEFAULT_INDEX)
 
-__all__ = ["distribution", "plot_distribution"]
+__all__ = ["distribution", "plot_distribution", "scan_images",
+           "load_index", "save_index", "IMAGE_EXTENSIONS", "DEFAULT_INDEX"]
@@ -1,17 +1,14 @@
-import os
 import matplotlib.pyplot as plt
+from .scanner import scan_images, DEFAULT_INDEX
 
 
-def distribution(path):
-    data_map = {}
-
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            if file.endswith(('.jpg', '.jpeg', '.png', '.JPG')):
-                label = os.path.basename(root)
-            if label not in data_map:
-                data_map[label] = 0
-            data_map[label] += 1
+def distribution(path, index_path=DEFAULT_INDEX, workers=8):
+    """
+    This function returns the number of images of each directory name
+    of path. Only the directories changed since the last scan recorded
+    in index_path are listed again.
+    """
+    data_map, _ = scan_images(path, index_path, workers)
     print(data_map)
     return data_map
 
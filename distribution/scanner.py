@@ -0,0 +1,142 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.JPG')
+INDEX_VERSION = 1
+DEFAULT_INDEX = os.path.join(".cache", "distribution.json")
+# Directories modified this recently are rescanned on the next scan:
+# a coarse mtime could otherwise hide a change made right after a scan
+RACY_SECONDS = 2
+
+
+def _scan_directory(directory):
+    """
+    List a directory once, returning its number of images and the names
+    of its subdirectories. Symbolic links to directories are not
+    followed, as os.walk does.
+    """
+    images = 0
+    dirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif entry.name.endswith(IMAGE_EXTENSIONS) and \
+                    not entry.is_dir():
+                images += 1
+    return images, sorted(dirs)
+
+
+def _directory_entry(root, relpath, known, racy_before):
+    """
+    Return the entry of root/relpath and whether it had to be listed,
+    None if it vanished. The entry recorded in known is reused as long
+    as the mtime of the directory did not change.
+    """
+    directory = os.path.join(root, relpath)
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return None, False
+    entry = known.get(relpath, None)
+    if entry is not None and entry["mtime"] == mtime:
+        return entry, False
+    images, dirs = _scan_directory(directory)
+    return {
+        "mtime": mtime if mtime < racy_before else None,
+        "images": images,
+        "dirs": dirs,
+    }, True
+
+
+def _scan_tree(root, relpath, known, racy_before):
+    """
+    Return the entries of the tree under root/relpath and the number
+    of directories that had to be listed.
+    """
+    entries = dict()
+    listed = 0
+    stack = [relpath]
+    while stack:
+        current = stack.pop()
+        entry, changed = _directory_entry(root, current, known, racy_before)
+        if entry is None:
+            continue
+        listed += changed
+        entries[current] = entry
+        stack += [os.path.join(current, name) for name in entry["dirs"]]
+    return entries, listed
+
+
+def load_index(index_path):
+    """
+    Return the directory entries recorded in an index file, by root,
+    or an empty index if it is missing, unreadable or outdated.
+    """
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(index, dict) or \
+            index.get("version", None) != INDEX_VERSION:
+        return dict()
+    return index.get("roots", dict())
+
+
+def save_index(index_path, roots):
+    """
+    Write the directory entries of every root to an index file,
+    atomically so a concurrent scan never reads it half written.
+    """
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": INDEX_VERSION, "roots": roots}, f)
+    os.replace(tmp_path, index_path)
+
+
+def scan_images(path, index_path=DEFAULT_INDEX, workers=8):
+    """
+    Return the number of images of each label of a directory, the label
+    of an image being the name of the directory holding it, and the
+    number of directories that had to be listed.
+    The subdirectories of path are walked in parallel threads. Every
+    directory is recorded in the index with its mtime, so a scan of an
+    unchanged tree only stats directories and a changed class folder is
+    the only one listed again. index_path None disables the index.
+    """
+    root = os.path.abspath(path)
+    roots = load_index(index_path) if index_path is not None else dict()
+    known = roots.get(root, dict())
+    racy_before = time.time_ns() - RACY_SECONDS * 10 ** 9
+
+    # The root itself, then each of its subtrees on a thread
+    top, listed = _directory_entry(root, ".", known, racy_before)
+    listed = int(listed)
+    entries = {".": top}
+    subtrees = [os.path.join(".", name) for name in top["dirs"]]
+    with ThreadPoolExecutor(max(1, min(workers, len(subtrees)))) as ex:
+        for subtree, count in ex.map(
+                lambda relpath: _scan_tree(root, relpath, known, racy_before),
+                subtrees):
+            entries.update(subtree)
+            listed += count
+
+    counts = dict()
+    for relpath in sorted(entries):
+        images = entries[relpath]["images"]
+        if images > 0:
+            label = os.path.basename(
+                os.path.normpath(os.path.join(root, relpath)))
+            counts[label] = counts.get(label, 0) + images
+
+    if index_path is not None:
+        roots[root] = entries
+        save_index(index_path, roots)
+    return counts, listed
@@ -0,0 +1,126 @@
+import os
+import sys
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils import Argument, StaticValidators, print_progress, run_jobs
+from transformation import (ImgTransformation, read_image, color_histograms,
+                            HISTOGRAM_CHANNELS, configure_backend)
+
+
+def arguments_logic():
+    cls = Argument(
+        "Export the color histograms of the leaves of a directory \
+to a parquet file")
+    cls.add_argument(
+        "-src",
+        type=str,
+        help="Path to the directory of images",
+    )
+    cls.add_argument(
+        "-dst",
+        type=str,
+        help="Path to the parquet file to write",
+        default="histograms.parquet"
+    )
+    cls.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes used",
+        default=1
+    )
+    cls.add_argument(
+        "--batch_size",
+        type=int,
+        help="Number of images per row group of the parquet file",
+        default=256
+    )
+    cls.add_argument(
+        "--backend",
+        type=str,
+        help="Backend of the mask operations, 'plantcv' or 'native'",
+        default="plantcv"
+    )
+    args = cls.get_args()
+    cls.add_validator(StaticValidators.validate_path_dir, args.src)
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.workers, 1, None))
+    cls.add_validator(StaticValidators.validate_number,
+                      (args.batch_size, 1, None))
+    cls.validate()
+    return args
+
+
+def histogram_schema():
+    """
+    One row per image: its path, its label (the name of its directory)
+    and one column of 256 values per channel.
+    """
+    fields = [pa.field("path", pa.string()), pa.field("label", pa.string())]
+    fields += [pa.field(name, pa.list_(pa.float32(), 256))
+               for name in HISTOGRAM_CHANNELS]
+    return pa.schema(fields)
+
+
+def histogram_file(img_path):
+    """
+    This function returns the color histograms of the leaf of an image.
+    """
+    cls = ImgTransformation(read_image(img_path))
+    return color_histograms(cls.img, cls.compute("kept_mask"))
+
+
+def write_rows(writer, rows):
+    columns = {
+        "path": [path for path, _, _ in rows],
+        "label": [label for _, label, _ in rows],
+    }
+    for index, name in enumerate(HISTOGRAM_CHANNELS):
+        columns[name] = [histograms[index] for _, _, histograms in rows]
+    writer.write_table(pa.table(columns, schema=writer.schema))
+
+
+def export_histograms(path, dst, workers=1, batch_size=256,
+                      backend="plantcv"):
+    """
+    This function streams the color histograms of every image of a
+    directory into a parquet file, batch_size images per row group.
+    """
+    allowed_extensions = (".jpg", ".JPG", ".jpeg")
+    jobs = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        jobs += [os.path.join(root, file) for file in sorted(files)
+                 if file.endswith(allowed_extensions)]
+
+    count = 0
+    failed = 0
+    rows = []
+    with pq.ParquetWriter(dst, histogram_schema()) as writer:
+        for img_path, histograms, error in run_jobs(
+                histogram_file, jobs, workers, configure_backend, (backend,)):
+            count += 1
+            if error is not None:
+                failed += 1
+                print(f"\nFailed {img_path}: {str(error)}", file=sys.stderr)
+            else:
+                rows.append((os.path.relpath(img_path, path),
+                             os.path.basename(os.path.dirname(img_path)),
+                             histograms))
+            if len(rows) >= batch_size:
+                write_rows(writer, rows)
+                rows = []
+            print_progress(count, len(jobs), failed)
+        if len(rows) > 0:
+            write_rows(writer, rows)
+    print(f"\nSaved the histograms of {count - failed} images to {dst}")
+
+
+if __name__ == "__main__":
+    try:
+        args = arguments_logic()
+        export_histograms(args.src, args.dst, args.workers,
+                          args.batch_size, args.backend)
+        exit(0)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        exit(1)
@@ -1,5 +1,6 @@
 import streamlit as st
-from augmentation import augmentation_from_img
+import numpy as np
+from augmentation import augmentation_from_img, augmentation_batch
 import PIL
 
 
@@ -12,11 +13,23 @@ st.write(
 )
 
 
+def load_batch(imgFiles):
+    """
+    This function stacks the uploaded images into an (N, H, W, 3) array,
+    resized to the size of the first one.
+    """
+    first = PIL.Image.open(imgFiles[0]).convert("RGB")
+    images = [first] + [PIL.Image.open(imgFile).convert("RGB").resize(
+        first.size) for imgFile in imgFiles[1:]]
+    return np.stack([np.asarray(img) for img in images])
+
+
 def view():
-    imgFile = st.file_uploader(
-        "image", type=["jpg", "jpeg", "JPG"])
+    imgFiles = st.file_uploader(
+        "image", type=["jpg", "jpeg", "JPG"], accept_multiple_files=True)
 
-    if imgFile:
+    if len(imgFiles) == 1:
+        imgFile = imgFiles[0]
         st.write("### Original image")
         st.image(imgFile, caption="Original Image", use_container_width=True)
 
@@ -29,6 +42,19 @@ def view():
                     st.write(img[0])
                     st.image(img[1], caption=img[0],
                              use_container_width=True)
+    elif len(imgFiles) > 1:
+        st.write("### Original images")
+        st.image(imgFiles, caption=[imgFile.name for imgFile in imgFiles],
+                 width=160)
+
+        if st.button("Show Augmented images"):
+            with st.spinner("Generating Augmented images..."):
+                batches = augmentation_batch(load_batch(imgFiles))
+                st.success("Images generated!")
+                for name, batch in batches:
+                    st.write(name)
+                    st.image(list(batch), caption=[
+                        imgFile.name for imgFile in imgFiles], width=160)
 
 
 view()
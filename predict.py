@@ -1,6 +1,7 @@
 import os
 import sys
-from predict import predict
+from predict import predict, predict_shards
+from storage import is_shard_dir
 from utils import Argument, StaticValidators
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -13,7 +14,18 @@ from an image passed as parameters")
     cls.add_argument(
         "file",
         str,
-        "Path to the img file",
+        "Path to the img file, a directory or a directory of packed shards",
+    )
+    cls.add_argument(
+        "--mixed_bfloat16",
+        action="store_true",
+        help="Compute in bfloat16, on CPUs with bfloat16 instructions \
+(AVX512-BF16 or AMX)",
+    )
+    cls.add_argument(
+        "--jit_compile",
+        action="store_true",
+        help="Compile the models with XLA",
     )
     args = cls.get_args()
     cls.add_validator(StaticValidators.validate_path, args.file)
@@ -27,7 +39,11 @@ def main(args):
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"image file '{image_path}' not found.")
     models_name = ["original", "mask", "no_bg"]
-    predict(image_path, models_name)
+    precision = "mixed_bfloat16" if args.mixed_bfloat16 else "float32"
+    if is_shard_dir(image_path):
+        predict_shards(image_path, models_name, precision, args.jit_compile)
+    else:
+        predict(image_path, models_name, precision, args.jit_compile)
 
 
 if __name__ == "__main__":
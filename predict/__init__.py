@@ -1,3 +1,3 @@
-from .predict import predict, predict_from_file
+from .predict import predict, predict_from_file, predict_shards
 
-__all__ = ["predict", "predict_from_file"]
+__all__ = ["predict", "predict_from_file", "predict_shards"]
@@ -5,6 +5,15 @@ import cv2
 from keras.api.models import load_model
 from keras import Model
 from transformation import transformation
+from storage import ShardReader
+from utils.precision import configure_precision, with_precision
+
+
+def get_array_imgage(image):
+    img_array = cv2.resize(image, (128, 128))
+    img_array = np.array(cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB))
+    img_array = np.expand_dims(img_array, axis=0)
+    return img_array
 
 
 def get_image(img_path: str, models_name: List[str]) -> tuple:
@@ -12,16 +21,18 @@ def get_image(img_path: str, models_name: List[str]) -> tuple:
     transformations = transformation(
         img_path, "", None, transformations)
 
-    def get_array_imgage(image):
-        img_array = cv2.resize(image, (128, 128))
-        img_array = np.array(cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB))
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array
-
     return [(name, get_array_imgage(transformations[name]))
             for name in models_name]
 
 
+def get_shard_images(images: dict, models_name: List[str]) -> tuple:
+    def decode(data):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+    return [(name, get_array_imgage(decode(images[name])))
+            for name in models_name]
+
+
 def predict_images(img_tuple: any, models: dict[str, Model]):
     class_names = ["Apple_Black_rot",
                    "Apple_healthy",
@@ -64,12 +75,20 @@ def predict_images(img_tuple: any, models: dict[str, Model]):
     return predictions_results
 
 
-def load_models(models_name: List[str] = None) -> dict[str, Model]:
+def load_models(models_name: List[str] = None, precision="float32",
+                jit_compile=False) -> dict[str, Model]:
+    """
+    Load the models of models_name, run in precision whatever the one
+    they were trained with, and compiled with XLA if jit_compile.
+    """
     try:
         models = dict()
+        precision = configure_precision(precision)
         for name in models_name:
-            models[name] = load_model(os.path.join(
-                "model", f"model_{name}.keras"))
+            models[name] = with_precision(load_model(os.path.join(
+                "model", f"model_{name}.keras")), precision)
+            if jit_compile:
+                models[name].jit_compile = True
         print("Models loaded successfully.")
     except Exception as e:
         print(f"Error loading model: {e}")
@@ -78,8 +97,9 @@ def load_models(models_name: List[str] = None) -> dict[str, Model]:
 
 
 def predict_from_file(file, filename='filename',
-                      models_name: List[str] = None):
-    models = load_models(models_name)
+                      models_name: List[str] = None, precision="float32",
+                      jit_compile=False):
+    models = load_models(models_name, precision, jit_compile)
     if models is None:
         return None
 
@@ -95,8 +115,9 @@ def predict_from_file(file, filename='filename',
         return None
 
 
-def predict(path: str, models_name: List[str] = None) -> List[bool]:
-    models = load_models(models_name)
+def predict(path: str, models_name: List[str] = None, precision="float32",
+            jit_compile=False) -> List[bool]:
+    models = load_models(models_name, precision, jit_compile)
     if models is None:
         return None
 
@@ -125,6 +146,32 @@ def predict(path: str, models_name: List[str] = None) -> List[bool]:
         return None
 
 
+def predict_shards(path: str, models_name: List[str] = None,
+                   precision="float32", jit_compile=False) -> List[bool]:
+    """
+    Predict every image of a directory of packed shards from its
+    precomputed variants, checking the prediction against its label.
+    """
+    models = load_models(models_name, precision, jit_compile)
+    if models is None:
+        return None
+
+    try:
+        predictions = []
+        reader = ShardReader(path)
+        for image_id, label, images in reader.images_by_id(models_name):
+            missing = [name for name in models_name if name not in images]
+            if len(missing) > 0:
+                raise ValueError(f"No {missing} variants for {image_id}.")
+            predictions.append(predict_images(
+                (get_shard_images(images, models_name), label), models))
+        accuracy = print_accuracy_report(predictions)
+        return predictions, accuracy
+    except Exception as e:
+        print(f"Error processing image: {e}")
+        return None
+
+
 def calculate_model_accuracy(predictions_list):
     """
     Calculate accuracy for each model from a list of prediction results.
@@ -0,0 +1,7 @@
+from .shards import ShardWriter, ShardReader, is_shard_dir
+from .catalog import Catalog, image_record
+from .tensors import TensorStore, compile_dataset, is_tensor_store
+
+__all__ = ["ShardWriter", "ShardReader", "is_shard_dir", "Catalog",
+           "image_record", "TensorStore", "compile_dataset",
+           "is_tensor_store"]
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import random
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".JPG")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    bytes INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    origin TEXT NOT NULL DEFAULT 'original',
+    operation TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS images_label ON images (label);
+CREATE INDEX IF NOT EXISTS images_source ON images (source);
+"""
+ORIGINS = ("original", "augmentation", "transformation")
+
+
+def _file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_record(path, stat=None):
+    """
+    Return the catalog row of an image file: its absolute path, label
+    (the name of its directory), content hash, dimensions (None if it
+    cannot be decoded), size in bytes and mtime.
+    """
+    path = os.path.abspath(path)
+    if stat is None:
+        stat = os.stat(path)
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        width = height = None
+    return {
+        "path": path,
+        "label": os.path.basename(os.path.dirname(path)),
+        "hash": _file_hash(path),
+        "width": width,
+        "height": height,
+        "bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _walk_images(directory):
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(IMAGE_EXTENSIONS) and \
+                        entry.is_file():
+                    yield entry
+
+
+def _under(directory):
+    # Path range of the files under directory, usable by the primary key
+    prefix = os.path.join(os.path.abspath(directory), "")
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class Catalog:
+    """
+    SQLite index of the images of the dataset, shared by the programs.
+    Each image is recorded with its label, content hash, dimensions,
+    size and the augmentation or transformation it came from.
+    The counts, samples and splits are read from the database alone:
+    the programs writing images add them with add, and update indexes
+    a whole directory again. Only the files whose size or mtime changed
+    are hashed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def update(self, directory, workers=8):
+        """
+        Index the images under directory: new and changed files are
+        hashed on workers threads, removed ones are dropped.
+        The origin of the images already recorded is kept.
+        Returns the number of images added or updated and removed.
+        """
+        low, high = _under(directory)
+        known = {row["path"]: (row["bytes"], row["mtime_ns"])
+                 for row in self._db.execute(
+                     "SELECT path, bytes, mtime_ns FROM images "
+                     "WHERE path >= ? AND path < ?", (low, high))}
+        changed = []
+        seen = set()
+        for entry in _walk_images(os.path.abspath(directory)):
+            stat = entry.stat()
+            seen.add(entry.path)
+            if known.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append((entry.path, stat))
+        removed = [path for path in known if path not in seen]
+        return self._apply(changed, removed, workers)
+
+    def add(self, paths, workers=8):
+        """
+        Index the given image files without listing any directory,
+        for the programs that know which files they wrote. Files
+        unchanged since they were indexed are not hashed again and
+        missing files are dropped.
+        Returns the number of images added or updated and removed.
+        """
+        changed = []
+        removed = []
+        for path in sorted({os.path.abspath(path) for path in paths}):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                removed.append(path)
+                continue
+            row = self._db.execute(
+                "SELECT bytes, mtime_ns FROM images WHERE path = ?",
+                (path,)).fetchone()
+            if row is None or (row["bytes"], row["mtime_ns"]) != \
+                    (stat.st_size, stat.st_mtime_ns):
+                changed.append((path, stat))
+        return self._apply(changed, removed, workers)
+
+    def _apply(self, changed, removed, workers):
+        with ThreadPoolExecutor(max(1, workers)) as executor:
+            records = list(executor.map(lambda job: image_record(*job),
+                                        changed))
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM images WHERE path = ?",
+                [(path,) for path in removed])
+            self._insert(records)
+        return len(records), len(removed)
+
+    def _insert(self, records):
+        self._db.executemany(
+            "INSERT INTO images (path, label, hash, width, height, bytes, "
+            "mtime_ns) VALUES (:path, :label, :hash, :width, :height, "
+            ":bytes, :mtime_ns) ON CONFLICT (path) DO UPDATE SET "
+            "label = excluded.label, hash = excluded.hash, "
+            "width = excluded.width, height = excluded.height, "
+            "bytes = excluded.bytes, mtime_ns = excluded.mtime_ns",
+            records)
+
+    def record_origin(self, outputs, origin):
+        """
+        Record where images came from. outputs are (path, source path,
+        operation) triples; the images must be indexed already.
+        """
+        if origin not in ORIGINS:
+            raise ValueError(f"Unknown origin '{origin}'. \
+Choose from {list(ORIGINS)}.")
+        with self._db:
+            self._db.executemany(
+                "UPDATE images SET origin = ?, source = ?, operation = ? "
+                "WHERE path = ?",
+                [(origin, os.path.abspath(source), operation,
+                  os.path.abspath(path))
+                 for path, source, operation in outputs])
+
+    def _select(self, columns, directory=None, label=None, origin=None):
+        query = f"SELECT {columns} FROM images WHERE 1"
+        params = []
+        if directory is not None:
+            query += " AND path >= ? AND path < ?"
+            params += _under(directory)
+        if label is not None:
+            query += " AND label = ?"
+            params.append(label)
+        if origin is not None:
+            query += " AND origin = ?"
+            params.append(origin)
+        return query, params
+
+    def images(self, directory=None, label=None, origin=None):
+        """
+        Return the rows of the images matching the filters, by path.
+        """
+        query, params = self._select("*", directory, label, origin)
+        return [dict(row) for row in self._db.execute(
+            query + " ORDER BY path", params)]
+
+    def distribution(self, directory=None, origin=None):
+        """
+        Return the number of images of each label, as distribution does.
+        """
+        query, params = self._select("label, COUNT(*)", directory,
+                                     origin=origin)
+        return dict(self._db.execute(
+            query + " GROUP BY label ORDER BY label", params).fetchall())
+
+    def sample(self, directory, count, seed=None, origin=None):
+        """
+        Return up to count random image paths of each label, by label.
+        """
+        rng = random.Random(seed)
+        by_label = dict()
+        for row in self.images(directory, origin=origin):
+            by_label.setdefault(row["label"], []).append(row["path"])
+        return {label: rng.sample(paths, min(count, len(paths)))
+                for label, paths in by_label.items()}
+
+    def split(self, directory, validation_split=0.2, seed=42):
+        """
+        Split the images under directory into train and validation
+        (path, label) lists, the same way for the same seed and images.
+        """
+        rows = [(row["path"], row["label"])
+                for row in self.images(directory)]
+        order = random.Random(seed).sample(range(len(rows)), len(rows))
+        nb_val = int(validation_split * len(rows))
+        return [rows[i] for i in order[nb_val:]], \
+            [rows[i] for i in order[:nb_val]]
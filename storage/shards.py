@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import shutil
+
+
+INDEX_NAME = "index.jsonl"
+SHARD_NAME = "shard-{:05d}.bin"
+SHARD_PATTERN = re.compile(r"shard-\d{5}\.bin")
+# Directory of the shards being written, moved in once complete
+STAGING_NAME = ".partial"
+
+
+def is_shard_dir(path):
+    """
+    Return whether path is a directory of packed shards.
+    """
+    return os.path.isfile(os.path.join(path, INDEX_NAME))
+
+
+class ShardWriter:
+    """
+    Pack encoded images into large sequential shard files.
+    Each image is appended to the current shard, a new shard is
+    started once it holds shard_bytes, and the index records the
+    image id, label, variant and where its bytes are.
+    The shards and index are written to a staging directory and only
+    replace the previous ones when the writer is closed, so an
+    interrupted run leaves the previous shards untouched.
+    """
+
+    def __init__(self, directory, shard_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.count = 0
+        self._staging = os.path.join(directory, STAGING_NAME)
+        # Leftovers of an interrupted run
+        shutil.rmtree(self._staging, ignore_errors=True)
+        os.makedirs(self._staging)
+        self._index = open(os.path.join(self._staging, INDEX_NAME), "w")
+        self._shard = None
+        self._number = -1
+        self._offset = 0
+
+    def _next_shard(self):
+        if self._shard is not None:
+            self._shard.close()
+        self._number += 1
+        self._offset = 0
+        self._shard = open(os.path.join(
+            self._staging, SHARD_NAME.format(self._number)), "wb")
+
+    def write(self, image_id, label, variant, data):
+        """
+        Append the encoded bytes of one variant of an image.
+        """
+        if self._shard is None or (
+                self._offset > 0 and
+                self._offset + len(data) > self.shard_bytes):
+            self._next_shard()
+        self._shard.write(data)
+        self._index.write(json.dumps({
+            "id": image_id,
+            "label": label,
+            "variant": variant,
+            "shard": self._number,
+            "offset": self._offset,
+            "length": len(data),
+        }) + "\n")
+        self._offset += len(data)
+        self.count += 1
+
+    def _close_files(self):
+        if self._shard is not None:
+            self._shard.close()
+        self._index.close()
+
+    def close(self):
+        """
+        Replace the previous shards of the directory by the new ones.
+        The index is removed first and moved in last: until then the
+        directory is not a shard directory.
+        """
+        self._close_files()
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        for entry in os.scandir(self.directory):
+            if SHARD_PATTERN.fullmatch(entry.name):
+                os.remove(entry.path)
+        for number in range(self._number + 1):
+            name = SHARD_NAME.format(number)
+            os.replace(os.path.join(self._staging, name),
+                       os.path.join(self.directory, name))
+        os.replace(os.path.join(self._staging, INDEX_NAME), index_path)
+        os.rmdir(self._staging)
+
+    def abort(self):
+        """
+        Drop the images written, keeping the previous shards.
+        """
+        self._close_files()
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ShardReader:
+    """
+    Read the images of a directory of packed shards through its index,
+    without listing any image file.
+    """
+
+    def __init__(self, directory):
+        if not is_shard_dir(directory):
+            raise AssertionError(f"{directory} is not a shard directory.")
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME), "r") as f:
+            self.entries = [json.loads(line) for line in f]
+
+    def shard_path(self, number):
+        return os.path.join(self.directory, SHARD_NAME.format(number))
+
+    def labels(self):
+        return sorted({entry["label"] for entry in self.entries})
+
+    def variants(self):
+        return sorted({entry["variant"] for entry in self.entries})
+
+    def select(self, variants=None):
+        """
+        Return the index entries of the given variants, all by default.
+        """
+        if variants is None:
+            return list(self.entries)
+        return [entry for entry in self.entries
+                if entry["variant"] in variants]
+
+    def read(self, entries):
+        """
+        Yield (entry, bytes) for entries, reading each shard
+        sequentially in the order the images were written.
+        """
+        entries = sorted(entries,
+                         key=lambda entry: (entry["shard"], entry["offset"]))
+        shard = None
+        number = None
+        try:
+            for entry in entries:
+                if entry["shard"] != number:
+                    if shard is not None:
+                        shard.close()
+                    number = entry["shard"]
+                    shard = open(self.shard_path(number), "rb")
+                shard.seek(entry["offset"])
+                yield entry, shard.read(entry["length"])
+        finally:
+            if shard is not None:
+                shard.close()
+
+    def entries_by_id(self, variants=None):
+        """
+        Return (id, label, {variant: entry}) for every image, in the
+        order they were written, without reading any shard.
+        """
+        images = dict()
+        for entry in self.select(variants):
+            images.setdefault(entry["id"], (entry["id"], entry["label"],
+                                            dict()))
+            images[entry["id"]][2][entry["variant"]] = entry
+        return list(images.values())
+
+    def images_by_id(self, variants=None):
+        """
+        Yield (id, label, {variant: bytes}) for every image,
+        in the order they were written.
+        """
+        current = None
+        for entry, data in self.read(self.select(variants)):
+            if current is not None and current[0] != entry["id"]:
+                yield current
+                current = None
+            if current is None:
+                current = (entry["id"], entry["label"], dict())
+            current[2][entry["variant"]] = data
+        if current is not None:
+            yield current
@@ -0,0 +1,151 @@
+import json
+import os
+import sys
+import numpy as np
+import cv2
+from utils import print_progress, run_jobs
+
+
+META_NAME = "meta.json"
+IMAGES_NAME = "images.npy"
+LABELS_NAME = "labels.npy"
+TENSORS_VERSION = 2
+
+
+def is_tensor_store(path):
+    """
+    Return whether path is a compiled tensor store.
+    """
+    return os.path.isfile(os.path.join(path, META_NAME))
+
+
+def list_class_images(path):
+    """
+    Return the class names of a directory (its sorted subdirectories)
+    and the (image path, label index) of every image under them.
+    """
+    allowed_extensions = (".jpg", ".jpeg", ".png")
+    class_names = sorted(entry.name for entry in os.scandir(path)
+                         if entry.is_dir())
+    images = []
+    for label, class_name in enumerate(class_names):
+        for root, dirs, files in os.walk(os.path.join(path, class_name)):
+            dirs.sort()
+            images += [(os.path.join(root, file), label)
+                       for file in sorted(files)
+                       if file.lower().endswith(allowed_extensions)]
+    return class_names, images
+
+
+def load_image(job):
+    """
+    Decode one image as an RGB uint8 array resized to image_size,
+    (height, width) as in TensorFlow.
+    """
+    img_path, (h, w) = job
+    image = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Could not read {img_path}.")
+    image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def compile_dataset(path, output_dir, split, image_size=(128, 128),
+                    workers=1):
+    """
+    Decode every image of a directory of class folders once and write
+    them to output_dir as an (N, H, W, 3) uint8 array file with their
+    labels, to be memory-mapped by the training runs.
+    split is the class names and the (paths, labels) of the training and
+    validation splits given by train.pipeline.split_files, so a compiled
+    dataset is split as its directory. The training split comes first,
+    so both splits are contiguous slices of the arrays.
+    The metadata is written last: an interrupted compilation leaves
+    no store behind.
+    """
+    class_names, splits = split
+    images = [image for paths, labels in splits
+              for image in zip(paths, labels)]
+    if len(images) == 0:
+        raise AssertionError(f"No images found in {path}.")
+    row_of = {img_path: row for row, (img_path, _) in enumerate(images)}
+
+    os.makedirs(output_dir, exist_ok=True)
+    meta_path = os.path.join(output_dir, META_NAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    h, w = image_size
+    tmp_path = os.path.join(output_dir, f"{IMAGES_NAME}.tmp")
+    array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                      shape=(len(images), h, w, 3))
+    jobs = [(img_path, image_size) for img_path, _ in images]
+    count = 0
+    failed = []
+    for job, image, error in run_jobs(load_image, jobs, workers):
+        count += 1
+        if error is not None:
+            failed.append(job[0])
+            print(f"\nFailed {job[0]}: {str(error)}", file=sys.stderr)
+        else:
+            array[row_of[job[0]]] = image
+        print_progress(count, len(jobs), len(failed))
+    array.flush()
+    del array
+    if len(failed) > 0:
+        os.remove(tmp_path)
+        raise AssertionError(f"{len(failed)} images of {path} could not \
+be decoded.")
+
+    os.replace(tmp_path, os.path.join(output_dir, IMAGES_NAME))
+    labels = np.array([label for _, label in images], dtype=np.int32)
+    np.save(os.path.join(output_dir, LABELS_NAME), labels)
+    with open(meta_path, "w") as f:
+        json.dump({
+            "version": TENSORS_VERSION,
+            "class_names": class_names,
+            "image_size": list(image_size),
+            "count": len(images),
+            "train": len(splits[0][0]),
+            "sources": [os.path.relpath(img_path, path)
+                        for img_path, _ in images],
+        }, f)
+    print(f"\nCompiled {len(images)} images of {path} into {output_dir}")
+
+
+class TensorStore:
+    """
+    Read-only view of a compiled tensor store. The images are
+    memory-mapped, so slicing them copies nothing and several
+    processes reading the same store share the page cache.
+    """
+
+    def __init__(self, path):
+        if not is_tensor_store(path):
+            raise AssertionError(f"{path} is not a compiled dataset.")
+        with open(os.path.join(path, META_NAME), "r") as f:
+            meta = json.load(f)
+        if meta.get("version", None) != TENSORS_VERSION:
+            raise AssertionError(f"{path} was compiled by another version, \
+compile it again.")
+        self.path = path
+        self.class_names = meta["class_names"]
+        self.image_size = tuple(meta["image_size"])
+        self.sources = meta["sources"]
+        self.nb_train = meta["train"]
+        self.images = np.load(os.path.join(path, IMAGES_NAME), mmap_mode="r")
+        self.labels = np.load(os.path.join(path, LABELS_NAME), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.labels)
+
+    def train(self):
+        """
+        Return the images and labels of the training split.
+        """
+        return self.images[:self.nb_train], self.labels[:self.nb_train]
+
+    def validation(self):
+        """
+        Return the images and labels of the validation split.
+        """
+        return self.images[self.nb_train:], self.labels[self.nb_train:]
@@ -2,23 +2,67 @@ import os
 import sys
 import argparse
 
-from train import train, load_split_dataset
+from train import (train, load_split_dataset, load_shard_dataset,
+                   load_catalog_dataset, parse_probabilities, train_joint,
+                   load_joint_dataset, load_joint_shard_dataset)
+from utils.precision import configure_precision
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 
+def jit_compile(args):
+    return True if args.jit_compile else "auto"
+
+
 def train_model(name, dataset_path, args):
-    if not os.path.exists(dataset_path):
+    augmentations = parse_probabilities(args.augment) \
+        if args.augment is not None else None
+    cache = os.path.join(args.cache, name) if args.cache else args.cache
+    if args.shards is not None:
+        df_train, df_val = load_shard_dataset(
+            args.shards, name, args.batch_size, augmentations=augmentations,
+            cache=cache)
+    elif not os.path.exists(dataset_path):
         raise FileNotFoundError(
             f"Dataset path '{dataset_path}' not found")
-    df_train, df_val = load_split_dataset(dataset_path, args.batch_size)
+    elif args.catalog is not None:
+        df_train, df_val = load_catalog_dataset(
+            args.catalog, dataset_path, args.batch_size,
+            augmentations=augmentations, cache=cache,
+            refresh=args.refresh_catalog)
+    else:
+        df_train, df_val = load_split_dataset(dataset_path, args.batch_size,
+                                              augmentations, cache)
     model = train(df_train, df_val, name, args.nb_filters,
-                  args.dropout, args.epochs, args.patience)
+                  args.dropout, args.epochs, args.patience,
+                  jit_compile(args))
     os.makedirs('model', exist_ok=True)
     model.save(f"model/model_{name}.keras")
     print(f"Model saved at 'model/model_{name}.keras'.")
 
 
+def train_joint_models(names, data_path, args):
+    augmentations = parse_probabilities(args.augment) \
+        if args.augment is not None else None
+    cache = os.path.join(args.cache, "joint") if args.cache else args.cache
+    if args.catalog is not None:
+        raise ValueError("--joint reads the dataset directories, \
+the compiled variants or the shards, not a catalog.")
+    if args.shards is not None:
+        df_train, df_val = load_joint_shard_dataset(
+            args.shards, names, args.batch_size, augmentations, cache)
+    else:
+        df_train, df_val = load_joint_dataset(
+            data_path, names, args.batch_size, augmentations, cache)
+    models = train_joint(df_train, df_val, names, args.nb_filters,
+                         args.dropout, args.epochs, args.patience,
+                         jit_compile(args))
+    os.makedirs('model', exist_ok=True)
+    for name, model in models.items():
+        model.save(f"model/model_{name}.keras")
+        print(f"Model saved at 'model/model_{name}.keras'.")
+
+
 def main():
     data_path = "dataset"
 
@@ -37,7 +81,45 @@ def main():
     parser.add_argument("--only", type=str, nargs="?",
                         help="train only the model. \
 Between ['original', 'mask', 'no_bg'].")
+    parser.add_argument("--shards", type=str,
+                        help="Train on the variants of this directory of \
+packed shards instead of the dataset directories.")
+    parser.add_argument("--catalog", type=str,
+                        help="Split the dataset directories from this \
+dataset catalog instead of listing them.")
+    parser.add_argument("--refresh_catalog", action="store_true",
+                        help="Index the dataset directories again in the \
+catalog before reading it.")
+    parser.add_argument("--augment", type=str, nargs="*",
+                        help="Augment the training images on the fly, \
+each operation with its probability, e.g. 'rotate=0.3 flip=0.5'. \
+Without values every operation is applied with probability 0.5.")
+    parser.add_argument("--cache", type=str, nargs="?", const="",
+                        help="Cache the decoded images so only the first \
+epoch decodes them: in memory without value, or on disk in this \
+directory. Clear the directory when the images change.")
+    parser.add_argument("--compiled", type=str,
+                        help="Train on the variants of this directory \
+written by compile_dataset.py, without decoding any image.")
+    parser.add_argument("--joint", action="store_true",
+                        help="Train the three models together on their \
+aligned images, reading the data once per epoch instead of three times.")
+    parser.add_argument("--mixed_bfloat16", action="store_true",
+                        help="Compute in bfloat16 with float32 weights, on \
+CPUs with bfloat16 instructions (AVX512-BF16 or AMX).")
+    parser.add_argument("--jit_compile", action="store_true",
+                        help="Compile the training steps with XLA.")
     args = parser.parse_args()
+    configure_precision("mixed_bfloat16" if args.mixed_bfloat16
+                        else "float32")
+    if args.compiled is not None:
+        data_path = args.compiled
+
+    if args.joint:
+        if args.only is not None:
+            raise ValueError("--joint trains every model, without --only.")
+        train_joint_models(["original", "mask", "no_bg"], data_path, args)
+        return
 
     if args.only is not None:
         if args.only not in ["original", "mask", "no_bg"]:
@@ -1,3 +1,12 @@
-from .train import train, create_model, load_split_dataset
+from .train import (train, create_model, load_split_dataset,
+                    load_shard_dataset, load_catalog_dataset,
+                    load_tensor_dataset)
+from .augmentation import augment_dataset, parse_probabilities
+from .joint import (train_joint, create_joint_model, load_joint_dataset,
+                    load_joint_shard_dataset, load_joint_tensor_dataset)
 
-__all__ = ["train", "create_model", "load_split_dataset"]
+__all__ = ["train", "create_model", "load_split_dataset",
+           "load_shard_dataset", "load_catalog_dataset",
+           "load_tensor_dataset", "augment_dataset", "parse_probabilities",
+           "train_joint", "create_joint_model", "load_joint_dataset",
+           "load_joint_shard_dataset", "load_joint_tensor_dataset"]
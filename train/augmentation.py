@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+from augmentation import AUGMENTATION_NAMES, AugmentationPipeline
+
+
+DEFAULT_PROBABILITY = 0.5
+
+
+def parse_probabilities(values):
+    """
+    Parse 'name=probability' strings into a probability per operation.
+    A bare name uses DEFAULT_PROBABILITY, no value at all enables
+    every operation with it.
+    """
+    if len(values) == 0:
+        return {name: DEFAULT_PROBABILITY for name in AUGMENTATION_NAMES}
+    probabilities = dict()
+    for value in values:
+        name, _, probability = value.partition("=")
+        if name not in AUGMENTATION_NAMES:
+            raise ValueError(f"Invalid augmentation '{name}'. \
+Choose from {AUGMENTATION_NAMES}.")
+        probability = float(probability) if probability else \
+            DEFAULT_PROBABILITY
+        if not 0 <= probability <= 1:
+            raise ValueError(f"Probability {probability} of {name} \
+is not in [0, 1].")
+        probabilities[name] = probability
+    return probabilities
+
+
+class AugmentationStats:
+    """
+    Count the images augmented and the time spent augmenting them,
+    summed over the parallel calls of the pipeline.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.images += 1
+            self.seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            images, seconds = self.images, self.seconds
+            self.images = 0
+            self.seconds = 0.0
+        return images, seconds
+
+
+def augment_image(image, probabilities, rng=random):
+    """
+    Apply each augmentation to an RGB uint8 array with its probability,
+    keeping the size of the image. The augmentations drawn are fused
+    into one AugmentationPipeline so the image is resampled once.
+    """
+    pipeline = AugmentationPipeline()
+    for name in AUGMENTATION_NAMES:
+        if rng.random() < probabilities.get(name, 0):
+            getattr(pipeline, name)()
+    h, w = image.shape[:2]
+    return pipeline.resize((w, h)).apply(image, rng)
+
+
+def augment_dataset(dataset, probabilities, batch_size=128):
+    """
+    Add a parallel augmentation stage to a batched image dataset:
+    every image gets fresh random augmentations each time it is read,
+    so each epoch sees new ones. dataset must be batched by batch_size.
+    The aligned inputs of a dataset of dicts of images get the same
+    augmentations.
+    The returned dataset keeps the length and the class_names of
+    dataset and has an augmentation_stats attribute.
+    """
+    stats = AugmentationStats()
+
+    def augment(*images):
+        start = time.perf_counter()
+        seed = random.getrandbits(64)
+        augmented = [augment_image(image.astype(np.uint8), probabilities,
+                                   random.Random(seed)).astype(np.float32)
+                     for image in images]
+        stats.add(time.perf_counter() - start)
+        return augmented
+
+    def augment_tensor(images, label):
+        flat = tf.nest.flatten(images)
+        augmented = tf.numpy_function(augment, flat,
+                                      [tf.float32] * len(flat))
+        for tensor, image in zip(augmented, flat):
+            tensor.set_shape(image.shape)
+        return tf.nest.pack_sequence_as(images, augmented), label
+
+    augmented = dataset.unbatch() \
+        .map(augment_tensor, num_parallel_calls=tf.data.AUTOTUNE) \
+        .batch(batch_size) \
+        .apply(tf.data.experimental.assert_cardinality(
+            dataset.cardinality())) \
+        .prefetch(tf.data.AUTOTUNE)
+    augmented.class_names = dataset.class_names
+    augmented.augmentation_stats = stats
+    return augmented
+
+
+class AugmentationThroughput(tf.keras.callbacks.Callback):
+    """
+    Report after each epoch how many images were augmented, the
+    augmentation work per image and the training throughput.
+    """
+
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+        self.epoch_start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.stats.reset()
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        images, seconds = self.stats.reset()
+        if images == 0:
+            return
+        print(f"\nAugmentation: {images} images, "
+              f"{seconds / images * 1000:.2f} ms of work per image, "
+              f"{images / elapsed:.1f} images/s through training")
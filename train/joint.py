@@ -0,0 +1,245 @@
+import os
+import numpy as np
+import tensorflow as tf
+import keras
+from keras.api.callbacks import EarlyStopping
+from storage import ShardReader, TensorStore, is_tensor_store
+from storage.tensors import list_class_images
+from .augmentation import augment_dataset, AugmentationThroughput
+from .pipeline import (make_dataset, make_array_dataset, cache_path,
+                       keep_attributes, shard_sources, InputWait)
+from .train import create_model, BatchHistory, draw_training, print_datasets
+
+
+# Suffixes the transformation outputs add to the name of their image
+VARIANT_SUFFIXES = ("_original", "_disease_mask", "_no_bg")
+
+
+def alignment_key(relative_path):
+    """
+    Return the key shared by the variants of one source image: its path
+    relative to the variant directory, without extension nor the suffix
+    of its transformation.
+    """
+    stem = os.path.splitext(relative_path)[0]
+    for suffix in VARIANT_SUFFIXES:
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+def align(keys_by_name):
+    """
+    Return the sorted keys found in every variant, reporting
+    the images left out for lack of a match.
+    """
+    common = set.intersection(*(set(keys) for keys in keys_by_name.values()))
+    for name, keys in keys_by_name.items():
+        if len(keys) > len(common):
+            print(f"{name}: {len(keys) - len(common)} images without a match "
+                  f"in every variant are left out.")
+    if len(common) == 0:
+        raise AssertionError(f"No image is found in every variant of \
+{sorted(keys_by_name)}.")
+    return sorted(common)
+
+
+def split_keys(keys, validation_split=0.2, seed=42):
+    order = np.random.RandomState(seed).permutation(len(keys))
+    nb_val = int(validation_split * len(keys))
+    return [keys[i] for i in order[nb_val:]], [keys[i] for i in order[:nb_val]]
+
+
+def with_labels_by_output(dataset, names):
+    """
+    Repeat the label of each element for every output of the model.
+    """
+    labelled = dataset.map(
+        lambda images, label: (images, {name: label for name in names}))
+    return keep_attributes(labelled, dataset)
+
+
+def finish_joint_datasets(df_train, df_val, names, batch_size, augmentations):
+    if augmentations is not None:
+        df_train = augment_dataset(df_train, augmentations, batch_size)
+    df_train = with_labels_by_output(df_train, names)
+    df_val = with_labels_by_output(df_val, names)
+    print_datasets(df_train, df_val)
+    return df_train, df_val
+
+
+def load_joint_dataset(path: str, names, batch_size=128, augmentations=None,
+                       cache=None):
+    """
+    Loads the aligned variants of the images of a dataset directory,
+    one sub-directory per name, into 2 tf.Datasets (train and
+    validation) of {name: image} inputs, each image read once per epoch
+    for all the models. Variants compiled with compile_dataset are
+    read from their stores.
+    """
+    if all(is_tensor_store(os.path.join(path, name)) for name in names):
+        return load_joint_tensor_dataset(path, names, batch_size,
+                                         augmentations)
+    files = dict()
+    class_names = None
+    for name in names:
+        variant_path = os.path.join(path, name)
+        if not os.path.isdir(variant_path):
+            raise AssertionError(f"file {variant_path} not found.")
+        variant_classes, images = list_class_images(variant_path)
+        if class_names is not None and variant_classes != class_names:
+            raise AssertionError(f"The classes of {variant_path} differ \
+from the ones of {names[0]}.")
+        class_names = variant_classes
+        files[name] = {
+            alignment_key(os.path.relpath(img_path, variant_path)):
+                (img_path, label)
+            for img_path, label in images}
+
+    keys = align({name: list(files[name]) for name in names})
+    df_train, df_val = [
+        make_dataset({name: [files[name][key][0] for key in split]
+                      for name in names},
+                     [files[names[0]][key][1] for key in split],
+                     class_names, batch_size, shuffle=shuffle,
+                     cache=cache_path(cache, cache_name))
+        for split, cache_name, shuffle in zip(split_keys(keys),
+                                              ("train", "val"),
+                                              (True, False))]
+    return finish_joint_datasets(df_train, df_val, names, batch_size,
+                                 augmentations)
+
+
+def load_joint_shard_dataset(path: str, names, batch_size=128,
+                             augmentations=None, cache=None):
+    """
+    Loads the aligned variants of a directory of packed shards into
+    2 tf.Datasets like load_joint_dataset.
+    """
+    reader = ShardReader(path)
+    class_names = reader.labels()
+    images = dict()
+    keys_by_name = {name: [] for name in names}
+    for image_id, label, variants in reader.entries_by_id(names):
+        images[image_id] = (label, variants)
+        for name in variants:
+            keys_by_name[name].append(image_id)
+
+    keys = align(keys_by_name)
+    df_train, df_val = [
+        make_dataset({name: shard_sources(
+                          reader, [images[key][1][name] for key in split])
+                      for name in names},
+                     [class_names.index(images[key][0]) for key in split],
+                     class_names, batch_size, shuffle=shuffle,
+                     cache=cache_path(cache, cache_name), from_shards=True)
+        for split, cache_name, shuffle in zip(split_keys(keys),
+                                              ("train", "val"),
+                                              (True, False))]
+    return finish_joint_datasets(df_train, df_val, names, batch_size,
+                                 augmentations)
+
+
+def load_joint_tensor_dataset(path: str, names, batch_size=128,
+                              augmentations=None):
+    """
+    Loads the aligned variants compiled with compile_dataset into
+    2 tf.Datasets like load_joint_dataset, gathering the rows of each
+    variant from its memory-mapped store. The split of the first
+    variant is used for all of them.
+    """
+    stores = {name: TensorStore(os.path.join(path, name)) for name in names}
+    reference = stores[names[0]]
+    for name, store in stores.items():
+        if store.class_names != reference.class_names:
+            raise AssertionError(f"The classes of {name} differ from the \
+ones of {names[0]}.")
+    rows = {name: {alignment_key(source): row
+                   for row, source in enumerate(store.sources)}
+            for name, store in stores.items()}
+    keys = align({name: list(rows[name]) for name in names})
+    labels = np.asarray(reference.labels)
+
+    splits = []
+    for in_train, shuffle in ((True, True), (False, False)):
+        split = [key for key in keys
+                 if (rows[names[0]][key] < reference.nb_train) == in_train]
+        split_rows = {name: np.array([rows[name][key] for key in split],
+                                     dtype=np.int64)
+                      for name in names}
+        splits.append(make_array_dataset(
+            {name: store.images for name, store in stores.items()},
+            labels[split_rows[names[0]]], reference.class_names, batch_size,
+            shuffle, rows=split_rows))
+    return finish_joint_datasets(*splits, names, batch_size, augmentations)
+
+
+def create_joint_model(names, nb_outputs, nb_filters=64, dropout=0.5,
+                       image_size=(128, 128), jit_compile="auto"):
+    """
+    Create one model per name and a model training them together,
+    each on its own input and output, so one pass over the data
+    trains all of them. Returns the joint model and the models by name.
+    """
+    members = {name: create_model(nb_outputs, nb_filters, dropout,
+                                  jit_compile)
+               for name in names}
+    inputs = {name: keras.Input(image_size + (3,), name=name)
+              for name in names}
+    joint = keras.Model(inputs, {name: members[name](inputs[name])
+                                 for name in names})
+    joint.compile(
+        optimizer="adam",
+        loss={name: tf.keras.losses.SparseCategoricalCrossentropy(
+            from_logits=False) for name in names},
+        metrics={name: ["accuracy"] for name in names},
+        jit_compile=jit_compile,
+    )
+    return joint, members
+
+
+def train_joint(df, df_val, names, nb_filters=48, dropout=0.3, epochs=10,
+                patience=3, jit_compile="auto"):
+    """
+    Train the models of names together on a dataset of aligned inputs
+    and return them by name, each usable and saved on its own.
+    Early stopping watches the sum of their validation losses.
+    """
+    print(f"{', '.join(names)} | Starting the joint training with settings:\
+\n{epochs} epochs\
+\nConvolution filters: {nb_filters}\
+\nDropout: {dropout}\
+\nPrecision: {keras.mixed_precision.global_policy().name}\
+\nXLA: {jit_compile}")
+
+    joint, members = create_joint_model(names, len(df.class_names),
+                                        nb_filters, dropout,
+                                        jit_compile=jit_compile)
+    early_stop = EarlyStopping(
+        monitor='val_loss',
+        patience=patience,
+        verbose=1,
+        mode='min',
+        restore_best_weights=True
+    )
+    batch_histories = {name: BatchHistory(f"{name}_") for name in names}
+    input_wait = InputWait()
+    callbacks = [early_stop, input_wait, *batch_histories.values()]
+    if hasattr(df, "augmentation_stats"):
+        callbacks.append(AugmentationThroughput(df.augmentation_stats))
+    history = joint.fit(input_wait.watch(df),
+                        epochs=epochs,
+                        validation_data=df_val,
+                        callbacks=callbacks)
+
+    results = joint.evaluate(df_val, return_dict=True)
+    for name in names:
+        print(f"{name} | Val Loss: {results[f'{name}_loss']:.4f}")
+        print(f"{name} | Val Accuracy: {results[f'{name}_accuracy']:.4f}")
+        draw_training(history, batch_histories[name], name, f"{name}_")
+    print(joint.summary())
+
+    for member in members.values():
+        # Saved with a built optimizer, the models load without warnings
+        member.optimizer.build(member.trainable_variables)
+    return members
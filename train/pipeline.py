@@ -0,0 +1,287 @@
+import collections
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from keras.api.utils import image_dataset_from_directory
+
+
+# Decoded images kept in the shuffle buffer of a cached dataset
+SHUFFLE_BUFFER = 2048
+
+
+def cache_path(cache, name):
+    """
+    Return the tf.data cache of one split: None without cache, '' to
+    cache in memory, or a file named name in the directory cache.
+    """
+    if cache is None or cache == "":
+        return cache
+    os.makedirs(cache, exist_ok=True)
+    return os.path.join(cache, name)
+
+
+def split_files(path, validation_split=0.2, seed=42):
+    """
+    List the images of a directory of class folders and split them
+    with image_dataset_from_directory, without decoding them.
+    Returns the class names and the (paths, labels) of the training
+    and validation splits.
+    """
+    try:
+        files_train, files_val = image_dataset_from_directory(
+            path, batch_size=None, validation_split=validation_split,
+            subset='both', shuffle=True, seed=seed)
+    except FileNotFoundError:
+        raise AssertionError(f"file {path} not found.")
+    class_names = files_train.class_names
+
+    def label(image_path):
+        return class_names.index(
+            os.path.relpath(image_path, path).split(os.sep)[0])
+
+    return class_names, [
+        (files.file_paths,
+         [label(image_path) for image_path in files.file_paths])
+        for files in (files_train, files_val)]
+
+
+def decode_image(data, image_size=(128, 128), quantize=False):
+    """
+    Decode an encoded image and resize it to image_size as an RGB
+    float32 tensor, as image_dataset_from_directory does. With quantize
+    the resized image is rounded to uint8, 4 times smaller to cache.
+    """
+    image = tf.io.decode_image(data, channels=3, expand_animations=False)
+    image = tf.image.resize(image, image_size)
+    if not quantize:
+        return image
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def read_shard_range(path, offset, length):
+    """
+    Read the encoded bytes of one image packed in a shard file.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def shard_sources(reader, entries):
+    """
+    Return the (shard path, offset, length) of shard index entries,
+    the sources of make_dataset with from_shards, so the images are
+    read from the shards as the pipeline needs them.
+    """
+    return [(reader.shard_path(entry["shard"]), entry["offset"],
+             entry["length"]) for entry in entries]
+
+
+def keep_attributes(dataset, source):
+    """
+    Copy the attributes the loaders set on source to dataset,
+    lost by tf.data transformations, and return dataset.
+    """
+    for name in ("class_names", "augmentation_stats"):
+        if hasattr(source, name):
+            setattr(dataset, name, getattr(source, name))
+    return dataset
+
+
+def make_dataset(sources, labels, class_names, batch_size=128,
+                 image_size=(128, 128), shuffle=False, cache=None,
+                 from_shards=False, seed=42):
+    """
+    Build the input pipeline of images given as file paths, or as
+    (shard path, offset, length) ranges of packed shards with
+    from_shards (see shard_sources). The images are read, decoded
+    and resized on parallel calls, optionally cached as uint8 (cache ''
+    keeps them in memory, a path on disk) so later epochs skip the
+    decoding, then shuffled, batched as float32 and prefetched.
+    sources may also be a dict of aligned lists, read as several inputs.
+    """
+    count = len(labels)
+
+    def to_tensors(values):
+        if not from_shards:
+            return tf.constant(list(values), dtype=tf.string)
+        paths, offsets, lengths = zip(*values) if len(values) > 0 \
+            else ((), (), ())
+        return (tf.constant(paths, dtype=tf.string),
+                tf.constant(offsets, dtype=tf.int64),
+                tf.constant(lengths, dtype=tf.int64))
+
+    if isinstance(sources, dict):
+        sources = {name: to_tensors(values)
+                   for name, values in sources.items()}
+    else:
+        sources = to_tensors(sources)
+    dataset = tf.data.Dataset.from_tensor_slices((
+        sources, tf.constant(list(labels), dtype=tf.int32)))
+    if shuffle:
+        # Shuffling the sources is cheap; a cache then fixes this order
+        # so its decoded images are shuffled again in a bounded buffer
+        dataset = dataset.shuffle(max(1, count), seed=seed,
+                                  reshuffle_each_iteration=cache is None)
+
+    def decode_one(source):
+        if from_shards:
+            data = tf.reshape(tf.numpy_function(
+                read_shard_range, list(source), tf.string), [])
+        else:
+            data = tf.io.read_file(source)
+        # Cached images are kept as uint8
+        return decode_image(data, image_size, quantize=cache is not None)
+
+    def decode(source, label):
+        if isinstance(source, dict):
+            return {name: decode_one(value)
+                    for name, value in source.items()}, label
+        return decode_one(source), label
+
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache is not None:
+        dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(max(1, min(count, SHUFFLE_BUFFER)),
+                                      seed=seed)
+    dataset = dataset.batch(batch_size) \
+        .map(lambda images, labels: (tf.nest.map_structure(
+            lambda batch: tf.cast(batch, tf.float32), images), labels),
+            num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+    dataset.class_names = class_names
+    return dataset
+
+
+def make_array_dataset(images, labels, class_names, batch_size=128,
+                       shuffle=False, seed=42, rows=None):
+    """
+    Build the input pipeline of (N, H, W, 3) uint8 images already
+    decoded, typically memory-mapped. Only indices go through tf.data:
+    each batch is gathered from the arrays, a contiguous slice without
+    shuffle, then cast to float32 and prefetched.
+    images may also be a dict of arrays read as several aligned inputs,
+    element i being the row rows[name][i] of images[name].
+    """
+    if isinstance(images, dict):
+        return _make_aligned_array_dataset(images, rows, labels, class_names,
+                                           batch_size, shuffle, seed)
+    count = len(labels)
+    _, h, w, c = images.shape
+
+    def gather(indices):
+        if shuffle:
+            # Sorted indices read the memory-mapped rows in file order
+            indices = np.sort(indices)
+            return images[indices], labels[indices].astype(np.int32)
+        start, stop = indices[0], indices[-1] + 1
+        return np.asarray(images[start:stop]), \
+            np.asarray(labels[start:stop], dtype=np.int32)
+
+    def load(indices):
+        batch_images, batch_labels = tf.numpy_function(
+            gather, [indices], (tf.uint8, tf.int32))
+        batch_images.set_shape((None, h, w, c))
+        batch_labels.set_shape((None,))
+        return tf.cast(batch_images, tf.float32), batch_labels
+
+    dataset = tf.data.Dataset.range(count)
+    if shuffle:
+        dataset = dataset.shuffle(max(1, count), seed=seed)
+    dataset = dataset.batch(batch_size) \
+        .map(load, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+    dataset.class_names = class_names
+    return dataset
+
+
+def _make_aligned_array_dataset(images, rows, labels, class_names,
+                                batch_size, shuffle, seed):
+    names = sorted(images)
+    labels = np.asarray(labels, dtype=np.int32)
+
+    def gather(indices):
+        indices = np.sort(indices)
+        return tuple(np.asarray(images[name][rows[name][indices]])
+                     for name in names) + (labels[indices],)
+
+    def load(indices):
+        *batches, batch_labels = tf.numpy_function(
+            gather, [indices], [tf.uint8] * len(names) + [tf.int32])
+        inputs = dict()
+        for name, batch in zip(names, batches):
+            batch.set_shape((None,) + images[name].shape[1:])
+            inputs[name] = tf.cast(batch, tf.float32)
+        batch_labels.set_shape((None,))
+        return inputs, batch_labels
+
+    dataset = tf.data.Dataset.range(len(labels))
+    if shuffle:
+        dataset = dataset.shuffle(max(1, len(labels)), seed=seed)
+    dataset = dataset.batch(batch_size) \
+        .map(load, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+    dataset.class_names = class_names
+    return dataset
+
+
+class InputWait(tf.keras.callbacks.Callback):
+    """
+    Measure after each epoch how long training waited for the input
+    pipeline. watch marks the moment each batch leaves the pipeline;
+    the time from the start of a step to that mark is spent waiting
+    for input, the rest computing. A large share of waiting means
+    training is input-bound. The first step is not counted: it traces
+    the model before asking for its batch.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+        self._ready = collections.deque()
+        self._step_start = None
+        self._epoch_start = None
+        self._wait = 0.0
+        self._first_step = True
+
+    def _mark(self):
+        self._ready.append(time.perf_counter())
+        return 0.0
+
+    def watch(self, dataset):
+        """
+        Return dataset with each batch marked as it is handed over.
+        """
+        def mark(images, labels):
+            done = tf.py_function(self._mark, [], tf.float64)
+            with tf.control_dependencies([done]):
+                return tf.nest.map_structure(tf.identity, images), labels
+
+        return keep_attributes(dataset.map(mark), dataset)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._ready.clear()
+        self._wait = 0.0
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        if len(self._ready) == 0:
+            return
+        ready = self._ready.popleft()
+        if self._first_step:
+            self._first_step = False
+        else:
+            self._wait += max(0.0, ready - self._step_start)
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._epoch_start
+        self.waits.append(self._wait)
+        if logs is not None:
+            logs["input_wait"] = self._wait
+        print(f"\nInput wait: {self._wait:.2f}s of {elapsed:.2f}s "
+              f"({self._wait / elapsed * 100:.1f}% of the epoch)")
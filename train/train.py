@@ -1,40 +1,138 @@
 import os
+import numpy as np
 import tensorflow as tf
+import keras
 import matplotlib.pyplot as plt
 from keras import layers, models
 from keras.api.callbacks import EarlyStopping
-from keras.api.utils import image_dataset_from_directory
+from storage import ShardReader, Catalog, TensorStore, is_tensor_store
+from .augmentation import augment_dataset, AugmentationThroughput
+from .pipeline import (make_dataset, make_array_dataset, cache_path,
+                       shard_sources, split_files, InputWait)
 import matplotlib
 matplotlib.use('TkAgg')
 
 
-def load_split_dataset(path: str, batch_size=128):
-    """
-    Loads directory of images and split it into 2 tf.Datasets
-    (train and validation)
-    """
-    try:
-        df_train, df_val = image_dataset_from_directory(path,
-                                                        image_size=(128, 128),
-                                                        batch_size=batch_size,
-                                                        validation_split=0.2,
-                                                        subset='both',
-                                                        shuffle=True,
-                                                        seed=42
-                                                        )
-    except FileNotFoundError:
-        raise AssertionError(f"file {path} not found.")
+def print_datasets(df_train, df_val):
     print(
         f"Loaded df_train: {df_train.element_spec} \
 - {len(df_train)} elements.")
     print(f"Loaded df_val: {df_val.element_spec} - {len(df_val)} elements.")
+
+
+def load_split_dataset(path: str, batch_size=128, augmentations=None,
+                       cache=None):
+    """
+    Loads directory of images and split it into 2 tf.Datasets
+    (train and validation)
+    augmentations: probability of each augmentation applied on the fly
+    to the training split, none if not given
+    cache: keep the decoded images in memory ('') or in this directory
+    so only the first epoch decodes them, none if not given
+    A dataset compiled with compile_dataset is read from its store.
+    """
+    if is_tensor_store(path):
+        return load_tensor_dataset(path, batch_size, augmentations)
+    class_names, splits = split_files(path)
+    df_train, df_val = [
+        make_dataset(paths, labels, class_names, batch_size,
+                     shuffle=shuffle, cache=cache_path(cache, name))
+        for (paths, labels), name, shuffle in zip(splits, ("train", "val"),
+                                                  (True, False))]
+    if augmentations is not None:
+        df_train = augment_dataset(df_train, augmentations, batch_size)
+    print_datasets(df_train, df_val)
+    return df_train, df_val
+
+
+def load_tensor_dataset(path: str, batch_size=128, augmentations=None):
+    """
+    Loads a dataset compiled with compile_dataset into 2 tf.Datasets
+    (train and validation). The decoded images are memory-mapped and
+    the splits are slices of them, so nothing is decoded nor copied
+    before a batch is gathered.
+    """
+    store = TensorStore(path)
+    df_train = make_array_dataset(*store.train(), store.class_names,
+                                  batch_size, shuffle=True)
+    df_val = make_array_dataset(*store.validation(), store.class_names,
+                                batch_size)
+    if augmentations is not None:
+        df_train = augment_dataset(df_train, augmentations, batch_size)
+    print_datasets(df_train, df_val)
+    return df_train, df_val
+
+
+def load_shard_dataset(path: str, variant: str, batch_size=128,
+                       image_size=(128, 128), augmentations=None,
+                       cache=None):
+    """
+    Loads one variant of a directory of packed shards and split it
+    into 2 tf.Datasets (train and validation) like load_split_dataset.
+    Only the index is loaded: each image is read from its shard and
+    decoded on the fly.
+    """
+    reader = ShardReader(path)
+    entries = reader.select([variant])
+    if len(entries) == 0:
+        raise AssertionError(f"No '{variant}' images in {path}.")
+    class_names = reader.labels()
+    sources = shard_sources(reader, entries)
+    labels = [class_names.index(entry["label"]) for entry in entries]
+
+    order = np.random.RandomState(42).permutation(len(entries))
+    nb_val = int(0.2 * len(entries))
+    df_train, df_val = [
+        make_dataset([sources[i] for i in indices],
+                     [labels[i] for i in indices], class_names, batch_size,
+                     image_size, shuffle, cache_path(cache, name),
+                     from_shards=True)
+        for indices, name, shuffle in ((order[nb_val:], "train", True),
+                                       (order[:nb_val], "val", False))]
+    if augmentations is not None:
+        df_train = augment_dataset(df_train, augmentations, batch_size)
+    print_datasets(df_train, df_val)
+    return df_train, df_val
+
+
+def load_catalog_dataset(catalog_path: str, path: str, batch_size=128,
+                         image_size=(128, 128), augmentations=None,
+                         cache=None, refresh=False):
+    """
+    Loads the images of a directory recorded in a dataset catalog and
+    split them into 2 tf.Datasets (train and validation) like
+    load_split_dataset, from the split of the catalog instead of a
+    listing of the directory. With refresh, the directory is indexed
+    again first.
+    """
+    with Catalog(catalog_path) as catalog:
+        if refresh:
+            catalog.update(path)
+        train_rows, val_rows = catalog.split(path, 0.2, seed=42)
+    if len(train_rows) + len(val_rows) == 0:
+        raise AssertionError(f"No images of {path} in {catalog_path}, \
+index them with --refresh_catalog.")
+    class_names = sorted({label for _, label in train_rows + val_rows})
+
+    df_train, df_val = [
+        make_dataset([image_path for image_path, _ in rows],
+                     [class_names.index(label) for _, label in rows],
+                     class_names, batch_size, image_size, shuffle,
+                     cache_path(cache, name))
+        for rows, name, shuffle in ((train_rows, "train", True),
+                                    (val_rows, "val", False))]
+    if augmentations is not None:
+        df_train = augment_dataset(df_train, augmentations, batch_size)
+    print_datasets(df_train, df_val)
     return df_train, df_val
 
 
 # Add this new class to track batch-level metrics
 class BatchHistory(tf.keras.callbacks.Callback):
-    def __init__(self):
+    def __init__(self, prefix=""):
         super().__init__()
+        # Prefix of the metrics of one output of a multi-output model
+        self.prefix = prefix
         self.batch_losses = []
         self.batch_accuracies = []
         self.batch_nums = []
@@ -43,8 +141,8 @@ class BatchHistory(tf.keras.callbacks.Callback):
         self.epoch_boundaries = [0]
 
     def on_train_batch_end(self, batch, logs=None):
-        self.batch_losses.append(logs.get('loss'))
-        self.batch_accuracies.append(logs.get('accuracy'))
+        self.batch_losses.append(logs.get(f'{self.prefix}loss'))
+        self.batch_accuracies.append(logs.get(f'{self.prefix}accuracy'))
         self.batch_nums.append(self.current_batch)
         self.current_batch += 1
 
@@ -53,11 +151,11 @@ class BatchHistory(tf.keras.callbacks.Callback):
         self.epoch_boundaries.append(self.current_batch)
 
 
-def draw_training(history, batch_history, name):
-    acc = history.history['accuracy']
-    val_acc = history.history['val_accuracy']
-    loss = history.history['loss']
-    val_loss = history.history['val_loss']
+def draw_training(history, batch_history, name, prefix=""):
+    acc = history.history[f'{prefix}accuracy']
+    val_acc = history.history[f'val_{prefix}accuracy']
+    loss = history.history[f'{prefix}loss']
+    val_loss = history.history[f'val_{prefix}loss']
     epochs_range = range(len(acc))
 
     # Create a figure with 4 subplots (2 rows, 2 columns)
@@ -112,7 +210,13 @@ def draw_training(history, batch_history, name):
     print(f"Training history plot saved to '{plot_path}'")
 
 
-def create_model(nb_outputs, nb_filters=64, dropout=0.5):
+def create_model(nb_outputs, nb_filters=64, dropout=0.5,
+                 jit_compile="auto"):
+    """
+    Build the model in the global dtype policy (see configure_precision),
+    its softmax output in float32. jit_compile True compiles the
+    training and inference steps with XLA; 'auto' leaves it off on CPU.
+    """
     model = models.Sequential([
         layers.Rescaling(1.0 / 255),
         layers.BatchNormalization(),
@@ -128,23 +232,28 @@ def create_model(nb_outputs, nb_filters=64, dropout=0.5):
         layers.Dense(256, activation="relu"),
         layers.Dropout(dropout),
         layers.Dense(128, activation="relu"),
-        layers.Dense(nb_outputs, activation="softmax")
+        layers.Dense(nb_outputs, activation="softmax", dtype="float32")
     ])
     model.compile(
         optimizer="adam",
         loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False),
         metrics=["accuracy"],
+        jit_compile=jit_compile,
     )
     return model
 
 
-def train(df, df_val, name, nb_filters=48, dropout=0.3, epochs=10, patience=3):
+def train(df, df_val, name, nb_filters=48, dropout=0.3, epochs=10, patience=3,
+          jit_compile="auto"):
     print(f"{name} | Starting model's training with settings:\
 \n{epochs} epochs\
 \nConvolution filters: {nb_filters}\
-\nDropout: {dropout}")
+\nDropout: {dropout}\
+\nPrecision: {keras.mixed_precision.global_policy().name}\
+\nXLA: {jit_compile}")
 
-    model = create_model(len(df.class_names), nb_filters, dropout)
+    model = create_model(len(df.class_names), nb_filters, dropout,
+                         jit_compile)
     early_stop = EarlyStopping(
         monitor='val_loss',
         patience=patience,
@@ -153,10 +262,14 @@ def train(df, df_val, name, nb_filters=48, dropout=0.3, epochs=10, patience=3):
         restore_best_weights=True
     )
     batch_history = BatchHistory()
-    history = model.fit(df,
+    input_wait = InputWait()
+    callbacks = [early_stop, batch_history, input_wait]
+    if hasattr(df, "augmentation_stats"):
+        callbacks.append(AugmentationThroughput(df.augmentation_stats))
+    history = model.fit(input_wait.watch(df),
                         epochs=epochs,
                         validation_data=df_val,
-                        callbacks=[early_stop, batch_history])
+                        callbacks=callbacks)
 
     loss, accuracy = model.evaluate(df_val)
     print(f"Val Loss: {loss:.4f}")
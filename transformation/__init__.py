@@ -1,3 +1,24 @@
-from .transformation import transformation, transformation_from_img
+from .transformation import (transformation, transformation_from_img,
+                             output_filename, DEFAULT_OUTPUTS,
+                             ImgTransformation, read_image)
+from .landmarks import save_landmarks
+from .color_histogram import color_histograms, HISTOGRAM_CHANNELS
+from .backends import configure_backend, get_backend, check_backends
+from .segmentation import (configure_segmentation, segmentation_settings,
+                           segmentation_stats)
+from .mask_cache import configure_mask_cache, get_mask_cache
+from .batch import mask_disease_batch
+from .manifest import Manifest, file_hash, pending_transformations
+from .writer import (configure_writer, get_writer, encode_image,
+                     writer_settings, IMAGE_FORMATS)
 
-__all__ = ["transformation", "transformation_from_img"]
+__all__ = ["transformation", "transformation_from_img",
+           "configure_segmentation", "segmentation_settings",
+           "segmentation_stats", "configure_mask_cache", "get_mask_cache",
+           "output_filename", "DEFAULT_OUTPUTS", "Manifest", "file_hash",
+           "pending_transformations", "mask_disease_batch",
+           "configure_backend", "get_backend", "check_backends",
+           "ImgTransformation",
+           "read_image", "save_landmarks", "color_histograms",
+           "HISTOGRAM_CHANNELS", "configure_writer", "get_writer",
+           "encode_image", "writer_settings", "IMAGE_FORMATS"]
@@ -0,0 +1,246 @@
+import cv2
+import numpy as np
+from plantcv import plantcv as pcv
+
+
+# Line of the a/b threshold used for the disease mask
+DISEASE_POINTS = [(55, 55), (100, 115)]
+
+
+def dual_channels_table(points, above=True):
+    """
+    Return the 256x256 table of pcv.threshold.dual_channels,
+    indexed by [y channel value, x channel value].
+    The line is evaluated with the same float64 operations as plantcv,
+    so looking a pixel up gives the exact same value.
+    """
+    (x0, y0), (x1, y1) = points[:2]
+    m = (y1 - y0) / (x1 - x0 + 1e-10)
+    b = y0 - m * x0
+    y_line = m * np.arange(256, dtype=np.float64) + b
+    y = np.arange(256, dtype=np.float64)[:, None]
+    if above:
+        table = 255 * (y > y_line)
+    else:
+        table = 255 * (y < y_line)
+    return table.astype(np.uint8)
+
+
+def threshold_tables(table):
+    """
+    Split a dual channels table into two lookup tables on the x channel:
+    the first y value kept for each x value (clipped to 255) and
+    whether any y value is kept at all. A pixel is kept when
+    y >= first[x] and valid[x], which only takes two cv2.LUT calls.
+    """
+    kept = table == 255
+    first = np.argmax(kept, axis=0).astype(np.uint8)
+    valid = np.where(kept.any(axis=0), 255, 0).astype(np.uint8)
+    return first, valid
+
+
+_first, _valid = threshold_tables(dual_channels_table(DISEASE_POINTS))
+
+
+def disease_threshold(lab, out=None):
+    """
+    Return the a/b disease threshold of a LAB image into out.
+    """
+    _, a, b = cv2.split(lab)
+    out = cv2.compare(b, cv2.LUT(a, _first), cv2.CMP_GE, dst=out)
+    return cv2.bitwise_and(out, cv2.LUT(a, _valid), dst=out)
+
+
+class PlantcvBackend:
+    """
+    Mask operations done with plantcv.
+    """
+    name = "plantcv"
+
+    @staticmethod
+    def lightness(img):
+        return pcv.rgb2gray_lab(img, channel='l')
+
+    @staticmethod
+    def threshold_light(gray_img, threshold):
+        return pcv.threshold.binary(gray_img, threshold, 'light')
+
+    @staticmethod
+    def fill(bin_img, size):
+        return pcv.fill(bin_img=bin_img, size=size)
+
+    @staticmethod
+    def erode(gray_img, ksize, i):
+        return pcv.erode(gray_img, ksize, i)
+
+    @staticmethod
+    def logical_and(bin_img1, bin_img2):
+        return pcv.logical_and(bin_img1, bin_img2)
+
+    @staticmethod
+    def logical_xor(bin_img1, bin_img2):
+        return pcv.logical_xor(bin_img1, bin_img2)
+
+    @staticmethod
+    def fill_holes(bin_img):
+        return pcv.fill_holes(bin_img=bin_img)
+
+    @staticmethod
+    def disease_threshold(img):
+        return pcv.threshold.dual_channels(img,
+                                           x_channel="a",
+                                           y_channel="b",
+                                           points=DISEASE_POINTS,
+                                           above=True
+                                           )
+
+    @staticmethod
+    def gaussian_blur(img, ksize):
+        return pcv.gaussian_blur(img=img, ksize=ksize, sigma_x=0, sigma_y=0)
+
+
+class NativeBackend:
+    """
+    The same mask operations done directly with OpenCV and NumPy,
+    without plantcv's validation, global state and copies.
+    Operations on intermediate masks are done in place.
+    """
+    name = "native"
+
+    @staticmethod
+    def lightness(img):
+        return cv2.extractChannel(cv2.cvtColor(img, cv2.COLOR_BGR2LAB), 0)
+
+    @staticmethod
+    def threshold_light(gray_img, threshold):
+        return cv2.threshold(gray_img, threshold, 255, cv2.THRESH_BINARY,
+                             dst=gray_img)[1]
+
+    @staticmethod
+    def fill(bin_img, size):
+        # Same as skimage remove_small_objects: 4-connected objects
+        # smaller than size pixels are removed
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(
+            bin_img, connectivity=4)
+        keep = np.where(stats[:, cv2.CC_STAT_AREA] < size, 0, 255)
+        keep[0] = 0
+        return keep.astype(np.uint8)[labels]
+
+    @staticmethod
+    def erode(gray_img, ksize, i):
+        kernel = np.ones((ksize, ksize), np.uint8)
+        return cv2.erode(gray_img, kernel, dst=gray_img, iterations=i)
+
+    @staticmethod
+    def logical_and(bin_img1, bin_img2):
+        return cv2.bitwise_and(bin_img1, bin_img2, dst=bin_img2)
+
+    @staticmethod
+    def logical_xor(bin_img1, bin_img2):
+        return cv2.bitwise_xor(bin_img1, bin_img2, dst=bin_img2)
+
+    @staticmethod
+    def fill_holes(bin_img):
+        # Same as scipy binary_fill_holes: the background reachable
+        # from the border (4-connected) is flooded, what is left are holes
+        h, w = bin_img.shape
+        flooded = np.zeros((h + 2, w + 2), np.uint8)
+        flooded[1:-1, 1:-1] = bin_img
+        cv2.floodFill(flooded, None, (0, 0), 255, flags=4)
+        holes = cv2.bitwise_not(flooded[1:-1, 1:-1])
+        return cv2.bitwise_or(bin_img, holes, dst=holes)
+
+    @staticmethod
+    def disease_threshold(img):
+        return disease_threshold(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))
+
+    @staticmethod
+    def gaussian_blur(img, ksize):
+        return cv2.GaussianBlur(img, ksize, 0, 0)
+
+
+BACKENDS = {
+    PlantcvBackend.name: PlantcvBackend,
+    NativeBackend.name: NativeBackend,
+}
+_settings = {
+    "backend": PlantcvBackend.name,
+}
+
+
+def configure_backend(name):
+    """
+    Set the backend used by default for the mask operations
+    of this process.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. \
+Choose from {list(BACKENDS)}.")
+    _settings["backend"] = name
+
+
+def get_backend(name=None):
+    """
+    Return a backend by name, or the default one of this process.
+    """
+    if name is None:
+        name = _settings["backend"]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. \
+Choose from {list(BACKENDS)}.")
+    return BACKENDS[name]
+
+
+def _backend_outputs(backend, img):
+    """
+    Run every mask operation of backend on a BGR image, each on its own
+    copy of the inputs as the native operations work in place.
+    """
+    gray = backend.lightness(img.copy())
+    mask = backend.threshold_light(gray.copy(), 120)
+    other = backend.threshold_light(backend.lightness(img[::-1].copy()), 20)
+    return {
+        "lightness": gray,
+        "threshold_light": mask,
+        "fill": backend.fill(mask.copy(), 50),
+        "erode": backend.erode(mask.copy(), 5, 1),
+        "logical_and": backend.logical_and(mask.copy(), other.copy()),
+        "logical_xor": backend.logical_xor(mask.copy(), other.copy()),
+        "fill_holes": backend.fill_holes(mask.copy()),
+        "disease_threshold": backend.disease_threshold(img.copy()),
+        "gaussian_blur": backend.gaussian_blur(mask.copy(), (3, 3)),
+    }
+
+
+def check_backends(size=256):
+    """
+    Check that every backend gives the results of the plantcv backend
+    on fixed synthetic images (uniform noise and blurred blobs), and
+    that the disease threshold lookup tables match the plantcv line on
+    every a/b pair. Raises an AssertionError listing the differences.
+    """
+    noise = np.random.RandomState(0).randint(0, 256, (size, size, 3),
+                                             dtype=np.uint8)
+    blobs = cv2.normalize(cv2.GaussianBlur(noise, (0, 0), 4), None, 0, 255,
+                          cv2.NORM_MINMAX)
+    images = {"noise": noise, "blobs": blobs}
+    # One pixel per a/b pair, a along the columns and b along the rows
+    a, b = np.meshgrid(np.arange(256), np.arange(256))
+    lab = np.dstack([np.full_like(a, 128), a, b]).astype(np.uint8)
+
+    differences = []
+    if not np.array_equal(disease_threshold(lab),
+                          dual_channels_table(DISEASE_POINTS)):
+        differences.append("disease_threshold table")
+    reference = {name: _backend_outputs(PlantcvBackend, img)
+                 for name, img in images.items()}
+    for backend in BACKENDS.values():
+        for name, img in images.items():
+            outputs = _backend_outputs(backend, img)
+            differences += [f"{backend.name} {key} of {name}"
+                            for key, result in outputs.items()
+                            if not np.array_equal(reference[name][key],
+                                                  result)]
+    if len(differences) > 0:
+        raise AssertionError(f"Results differ from plantcv: \
+{', '.join(differences)}.")
@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+from .backends import disease_threshold
+from .transformation import foreground_mask
+
+
+def mask_disease_batch(images, filled=None, chunk_size=32):
+    """
+    Return the disease masks of a stack of same-sized BGR images.
+    images is an (N, H, W, 3) uint8 array, filled the (N, H, W) leaf
+    masks (computed with foreground_mask when not given).
+    The LAB conversion and the a/b threshold run on chunk_size images
+    at a time with OpenCV; the masks are bit-identical to
+    ImgTransformation.mask_disease.
+    """
+    images = np.asarray(images)
+    if images.ndim != 4 or images.shape[-1] != 3 or \
+            images.dtype != np.uint8:
+        raise ValueError("images must be an (N, H, W, 3) uint8 array.")
+    n, h, w, _ = images.shape
+    if filled is None:
+        filled = np.stack([foreground_mask(image) for image in images])
+
+    masks = np.empty((n, h, w), dtype=np.uint8)
+    for start in range(0, n, chunk_size):
+        block = images[start:start + chunk_size]
+        rows = len(block) * h
+        out = masks[start:start + chunk_size].reshape(rows, w)
+        lab = cv2.cvtColor(block.reshape(rows, w, 3), cv2.COLOR_BGR2LAB)
+        disease_threshold(lab, out=out)
+        cv2.bitwise_xor(out, filled[start:start + chunk_size].reshape(
+            rows, w), dst=out)
+    return masks
@@ -1,8 +1,39 @@
 
+import cv2
+import numpy as np
 import matplotlib.pyplot as plt
 from plantcv import plantcv as pcv
 
 
+# Channels of the numeric histograms, in order: BGR, LAB then HSV
+HISTOGRAM_CHANNELS = [
+    "blue", "green", "red",
+    "lightness", "green-magenta", "blue-yellow",
+    "hue", "saturation", "value",
+]
+
+
+def color_histograms(image, mask):
+    """
+    Return the 256-bin histograms of the nine channels of HISTOGRAM_CHANNELS
+    inside mask, as a (9, 256) float32 array of percent of pixels.
+    Values are the OpenCV 8-bit ones: hue only goes up to 179.
+    """
+    pixels = np.concatenate([
+        image,
+        cv2.cvtColor(image, cv2.COLOR_BGR2LAB),
+        cv2.cvtColor(image, cv2.COLOR_BGR2HSV),
+    ], axis=2)[mask > 0]
+    if len(pixels) == 0:
+        return np.zeros((len(HISTOGRAM_CHANNELS), 256), dtype=np.float32)
+    # Shift each channel to its own range of bins to count them at once
+    offsets = np.arange(len(HISTOGRAM_CHANNELS), dtype=np.intp) * 256
+    counts = np.bincount((pixels + offsets).ravel(),
+                         minlength=len(HISTOGRAM_CHANNELS) * 256)
+    histograms = counts.reshape(len(HISTOGRAM_CHANNELS), 256)
+    return (histograms * (100 / len(pixels))).astype(np.float32)
+
+
 def plot_stat_hist(key, val):
     scl, color = val
     # outputs observation of the last pcv
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+from plantcv import plantcv as pcv
+
+
+# Landmark sets of x_axis_pseudolandmarks with the color they are drawn in
+LANDMARK_COLORS = {
+    "top": (255, 0, 0),
+    "bottom": (255, 0, 255),
+    "center_v": (0, 79, 255),
+}
+NB_LANDMARKS = 20
+
+
+def x_axis_landmarks(img, mask):
+    """
+    Return the x axis pseudolandmarks of the object in mask as
+    (20, 2) float arrays of (x, y) coordinates, NaN if there is no object.
+    """
+    debug = pcv.params.debug
+    pcv.params.debug = None
+    points = pcv.homology.x_axis_pseudolandmarks(
+        img=img, mask=mask, label='default'
+    )
+    pcv.params.debug = debug
+
+    landmarks = dict()
+    for name, value in zip(LANDMARK_COLORS, points):
+        if isinstance(value, tuple):
+            landmarks[name] = np.full((NB_LANDMARKS, 2), np.nan)
+        else:
+            landmarks[name] = np.asarray(value, dtype=np.float64).reshape(
+                NB_LANDMARKS, 2)
+    return landmarks
+
+
+def draw_landmarks(img, landmarks):
+    """
+    Return a copy of img with the landmarks drawn as plantcv does.
+    """
+    drawn = img.copy()
+    for name, color in LANDMARK_COLORS.items():
+        for x, y in landmarks[name]:
+            if np.isnan(x) or np.isnan(y):
+                continue
+            cv2.circle(drawn, (int(x), int(y)), pcv.params.line_thickness,
+                       color, -1)
+    return drawn
+
+
+def save_landmarks(path, landmarks_by_name):
+    """
+    Save the landmarks of many images in one .npz file: 'names' holds
+    the image names and each landmark set an (N, 20, 2) array.
+    """
+    names = sorted(landmarks_by_name)
+    arrays = {
+        key: np.stack([landmarks_by_name[name][key] for name in names])
+        if len(names) > 0 else np.empty((0, NB_LANDMARKS, 2))
+        for key in LANDMARK_COLORS
+    }
+    np.savez_compressed(path, names=np.array(names), **arrays)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    Return the sha256 of a file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_outdated(entry, input_hash, settings):
+    """
+    Return whether the outputs recorded as entry were produced from
+    another input or with other output settings.
+    """
+    return entry is None or entry["hash"] != input_hash or \
+        entry.get("settings") != settings
+
+
+def pending_transformations(entry, output_dir, input_hash, transformations,
+                            settings=None):
+    """
+    Return the transformations still to be done for an input recorded
+    as entry: all of them if the input is new or changed or the output
+    settings changed, otherwise those never produced or whose output
+    file is gone.
+    """
+    if is_outdated(entry, input_hash, settings):
+        return list(transformations)
+    return [name for name in transformations
+            if name not in entry["outputs"] or not os.path.exists(
+                os.path.join(output_dir, entry["outputs"][name]))]
+
+
+class Manifest:
+    """
+    Record of a batch transformation, stored in the destination
+    directory. Each input (relative to the source directory) is
+    recorded with its hash, the transformations requested, the
+    outputs produced (relative to the destination directory) and the
+    settings they were produced with.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = dict()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)["entries"]
+
+    def record(self, key, input_hash, transformations, outputs,
+               settings=None):
+        """
+        Record the outputs produced for an input. Outputs of an
+        unchanged input produced with the same settings are merged
+        with the ones already recorded.
+        """
+        entry = self.entries.get(key)
+        if is_outdated(entry, input_hash, settings):
+            entry = {"hash": input_hash, "settings": settings,
+                     "transformations": [], "outputs": dict()}
+        entry["transformations"] = sorted(
+            set(entry["transformations"]) | set(transformations))
+        entry["outputs"].update({
+            name: os.path.relpath(path, self.output_dir)
+            for name, path in outputs.items()
+        })
+        self.entries[key] = entry
+
+    def save(self):
+        """
+        Write the manifest atomically so an interrupted run
+        always leaves a readable manifest behind.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import numpy as np
+
+
+_settings = {
+    "directory": os.path.join(".cache", "masks"),
+    "max_bytes": 512 * 1024 * 1024,
+    "enabled": True,
+}
+_cache = None
+
+
+class MaskCache:
+    """
+    Persistent cache of binary foreground masks.
+    Masks are keyed by the hash of the image content and of the
+    segmentation settings, stored bit-packed and evicted in least
+    recently used order once the cache grows over max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    @staticmethod
+    def key(image, settings_key):
+        """
+        Return the cache key of an image for the given settings.
+        """
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha256()
+        digest.update(settings_key.encode())
+        digest.update(f"{image.shape}{image.dtype}".encode())
+        digest.update(image.data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".npz"):
+                    yield entry
+
+    def size(self):
+        """
+        Return the number of bytes used by the cache on disk.
+        """
+        if self._size is None:
+            self._size = sum(entry.stat().st_size
+                             for entry in self._entries())
+        return self._size
+
+    def get(self, key):
+        """
+        Return the mask stored under key, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                shape = tuple(data["shape"])
+                bits = data["bits"]
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        mask = np.unpackbits(bits, count=int(np.prod(shape)))
+        return mask.reshape(shape) * np.uint8(255)
+
+    def put(self, key, mask):
+        """
+        Store a mask under key and evict old masks if needed.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Counted before the new mask is written, without the one it
+        # replaces
+        size = self.size()
+        if os.path.exists(path):
+            size -= os.path.getsize(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, shape=np.array(mask.shape),
+                                bits=np.packbits(mask > 0))
+        os.replace(tmp_path, path)
+        self._size = size + os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used masks until the cache
+        is back under 90% of max_bytes.
+        """
+        entries = sorted(((entry.stat(), entry.path)
+                          for entry in self._entries()),
+                         key=lambda item: item[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+        self._size = size
+
+
+def configure_mask_cache(directory=None, max_bytes=None, enabled=None):
+    """
+    Set the directory, the size limit and the activation
+    of the mask cache of this process.
+    """
+    global _cache
+    if directory is not None:
+        _settings["directory"] = directory
+    if max_bytes is not None:
+        _settings["max_bytes"] = max_bytes
+    if enabled is not None:
+        _settings["enabled"] = enabled
+    _cache = None
+
+
+def get_mask_cache():
+    """
+    Return the mask cache of this process, or None if it is disabled.
+    """
+    global _cache
+    if not _settings["enabled"]:
+        return None
+    if _cache is None:
+        _cache = MaskCache(_settings["directory"], _settings["max_bytes"])
+    return _cache
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+
+
+def guided_filter(guide, src, radius, eps):
+    """
+    Edge-preserving smoothing of src following the edges of guide
+    (He et al. guided filter), both float32 images in [0, 1].
+    """
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    def box(img):
+        return cv2.boxFilter(img, -1, ksize, borderType=cv2.BORDER_REFLECT)
+
+    mean_guide = box(guide)
+    mean_src = box(src)
+    var_guide = box(guide * guide) - mean_guide * mean_guide
+    cov = box(guide * src) - mean_guide * mean_src
+    a = cov / (var_guide + eps)
+    b = mean_src - a * mean_guide
+    return box(a) * guide + box(b)
+
+
+def upsample_mask(mask, image, eps=1e-3):
+    """
+    Bring a binary mask computed on a downscaled copy of image back to
+    the size of image. The bilinear upsampling is refined with a guided
+    filter on the full resolution image so the mask border snaps back
+    to the edges of the leaf.
+    """
+    h, w = image.shape[:2]
+    radius = max(2, round(w / mask.shape[1]))
+    soft = cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+    soft = soft.astype(np.float32) / 255
+    guide = cv2.cvtColor(image[..., :3], cv2.COLOR_BGR2GRAY)
+    guide = guide.astype(np.float32) / 255
+    refined = guided_filter(guide, soft, radius, eps)
+    return np.where(refined > 0.5, 255, 0).astype(np.uint8)
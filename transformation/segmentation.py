@@ -0,0 +1,108 @@
+import os
+import time
+import onnxruntime as ort
+from rembg.sessions import sessions_class
+
+
+_settings = {
+    "model_name": "u2net",
+    "num_threads": None,
+    "scale": 1.0,
+}
+_session = None
+_stats = {
+    "loads": 0,
+    "setup_seconds": 0.0,
+    "uses": 0,
+}
+
+
+def configure_segmentation(model_name=None, num_threads=None, scale=None):
+    """
+    Set the rembg model and the number of ONNX threads used by
+    the segmentation session of this process, and the scale the
+    images are segmented at.
+    The session is created again on its next use if a setting changed.
+    """
+    global _session
+    settings = dict(_settings)
+    if model_name is not None:
+        if model_name not in [cls.name() for cls in sessions_class]:
+            raise ValueError(f"Unknown segmentation model '{model_name}'.")
+        settings["model_name"] = model_name
+    if num_threads is not None:
+        settings["num_threads"] = num_threads
+    if scale is not None:
+        if not 0 < scale <= 1:
+            raise ValueError(f"Segmentation scale {scale} is not in ]0, 1].")
+        _settings["scale"] = scale
+        settings["scale"] = scale
+    if settings != _settings:
+        _settings.update(settings)
+        _session = None
+
+
+def segmentation_settings():
+    """
+    Return a copy of the segmentation settings of this process.
+    """
+    return dict(_settings)
+
+
+def segmentation_key(scale=None):
+    """
+    Return a string identifying the settings that change the masks,
+    used to key the mask cache.
+    """
+    if scale is None:
+        scale = _settings["scale"]
+    key = f"model={_settings['model_name']}"
+    if scale != 1:
+        key += f";scale={scale}"
+    return key
+
+
+def _new_session():
+    session_class = next(cls for cls in sessions_class
+                         if cls.name() == _settings["model_name"])
+    sess_opts = ort.SessionOptions()
+    threads = _settings["num_threads"]
+    if threads is None and "OMP_NUM_THREADS" in os.environ:
+        threads = int(os.environ["OMP_NUM_THREADS"])
+    if threads is not None:
+        sess_opts.inter_op_num_threads = threads
+        sess_opts.intra_op_num_threads = threads
+    return session_class(_settings["model_name"], sess_opts)
+
+
+def get_session():
+    """
+    Return the long-lived rembg session of this process,
+    creating it on first use.
+    """
+    global _session
+    if _session is None:
+        start = time.perf_counter()
+        _session = _new_session()
+        _stats["setup_seconds"] += time.perf_counter() - start
+        _stats["loads"] += 1
+    _stats["uses"] += 1
+    return _session
+
+
+def segmentation_stats():
+    """
+    Return how many times the session was used in this process and
+    the setup time saved by not creating a session for every image.
+    """
+    loads = _stats["loads"]
+    setup = _stats["setup_seconds"]
+    saved = setup / loads * (_stats["uses"] - loads) if loads else 0.0
+    return {
+        "pid": os.getpid(),
+        "model_name": _settings["model_name"],
+        "loads": loads,
+        "uses": _stats["uses"],
+        "setup_seconds": setup,
+        "saved_seconds": saved,
+    }
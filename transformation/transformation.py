@@ -1,223 +1,274 @@
 from plantcv import plantcv as pcv
 import cv2
-import os
 from .color_histogram import plot_histogram
+from .landmarks import x_axis_landmarks, draw_landmarks
 from rembg import remove
+from .backends import get_backend
+from .segmentation import get_session, segmentation_key, \
+    segmentation_settings
+from .refine import upsample_mask
+from .mask_cache import get_mask_cache
+from .writer import get_writer, image_extension
 
 
-def remove_background_rembg(image):
-    shadow_mask = pcv.rgb2gray_lab(image, channel='l')
-    shadow_mask = pcv.threshold.binary(shadow_mask, 1, 'light')
-    shadow_mask = pcv.fill(bin_img=shadow_mask, size=500)
-    shadow_mask = pcv.erode(shadow_mask, 5, 1)
+def leaf_mask(image, removed, backend=None, scale=1.0):
+    """
+    Return the leaf mask of an image from its rembg cut-out,
+    dropping the shadows left around the leaf.
+    scale is the one of image compared to the source image,
+    the object and kernel sizes are scaled accordingly.
+    """
+    backend = get_backend(backend)
+    shadow_mask = backend.lightness(image)
+    shadow_mask = backend.threshold_light(shadow_mask, 1)
+    shadow_mask = backend.fill(shadow_mask, max(1, round(500 * scale ** 2)))
+    shadow_mask = backend.erode(shadow_mask, max(2, round(5 * scale)), 1)
+
+    grey_scale = backend.lightness(removed)
+    mask_withoutbg = backend.threshold_light(grey_scale, 20)
+    mask_withoutbg = backend.logical_and(shadow_mask, mask_withoutbg)
+    return backend.fill_holes(mask_withoutbg)
 
-    result = remove(image)
-    grey_scale = pcv.rgb2gray_lab(result, channel='l')
-    mask_withoutbg = pcv.threshold.binary(grey_scale, 20, 'light')
-    mask_withoutbg = pcv.logical_and(shadow_mask, mask_withoutbg)
-    return pcv.fill_holes(bin_img=mask_withoutbg)
+
+def remove_background_rembg(image, session=None, backend=None,
+                            segmentation_scale=None):
+    """
+    Return the leaf mask of an image. With a segmentation_scale below 1,
+    rembg, the threshold and the fill run on a downscaled copy of the
+    image and the mask is upsampled back with an edge-aware refinement.
+    """
+    if session is None:
+        session = get_session()
+    if segmentation_scale is None:
+        segmentation_scale = segmentation_settings()["scale"]
+    if segmentation_scale >= 1:
+        return leaf_mask(image, remove(image, session=session), backend)
+
+    h, w = image.shape[:2]
+    small = cv2.resize(image, (max(1, round(w * segmentation_scale)),
+                               max(1, round(h * segmentation_scale))),
+                       interpolation=cv2.INTER_AREA)
+    mask = leaf_mask(small, remove(small, session=session), backend,
+                     segmentation_scale)
+    return get_backend(backend).fill_holes(upsample_mask(mask, image))
+
+
+def foreground_mask(image, backend=None, segmentation_scale=None):
+    """
+    Return the leaf mask of an image, reading it from the mask cache
+    when this image was already segmented with the same settings.
+    """
+    cache = get_mask_cache()
+    if cache is None:
+        return remove_background_rembg(image, backend=backend,
+                                       segmentation_scale=segmentation_scale)
+    key = cache.key(image, segmentation_key(segmentation_scale))
+    mask = cache.get(key)
+    if mask is None:
+        mask = remove_background_rembg(image, backend=backend,
+                                       segmentation_scale=segmentation_scale)
+        cache.put(key, mask)
+    return mask
+
+
+# Output name -> (graph node, suffix of the printed file)
+OUTPUTS = {
+    "original": ("original", "original"),
+    "no_bg": ("no_bg", "no_bg"),
+    "mask": ("disease_mask", "disease_mask"),
+    "blur": ("blur", "gaussian_blur"),
+    "roi": ("roi", "roi_objects"),
+    "analyze": ("analyze", "analyze_object"),
+    "pseudolandmarks": ("pseudolandmarks", "pseudolandmarks"),
+}
+DEFAULT_OUTPUTS = ["original", "no_bg", "mask", "blur", "roi", "analyze"]
+
+
+def output_filename(dst, name):
+    """
+    Return the file an output is printed to, with the extension
+    of the image format of the writer.
+    """
+    return "{0}_{1}{2}".format(dst, OUTPUTS[name][1], image_extension())
 
 
 class ImgTransformation:
-    def __init__(self, img, dst=None, pcv_option=None):
+    # Graph node -> (nodes it is computed from, method computing it)
+    GRAPH = {
+        "original": ((), "_compute_original"),
+        "filled": ((), "_compute_filled"),
+        "disease_mask": (("filled",), "_compute_disease_mask"),
+        "no_bg": (("filled",), "_compute_no_bg"),
+        "blur": (("disease_mask",), "_compute_blur"),
+        "kept_mask": (("disease_mask",), "_compute_kept_mask"),
+        "roi": (("kept_mask",), "_compute_roi"),
+        "analyze": (("kept_mask",), "_compute_analyze"),
+        "landmarks": (("kept_mask",), "_compute_landmarks"),
+        "pseudolandmarks": (("landmarks",), "_compute_pseudolandmarks"),
+    }
+
+    def __init__(self, img, dst=None, pcv_option=None, backend=None,
+                 segmentation_scale=None):
         self.img = img
         self.dst = dst
-
-        self._filled = remove_background_rembg(self.img)
-
         self._pcv_option = pcv_option
-        self._disease_mask = None
-        self._g_blur = None
-        self._no_bg = None
-        self._mask = None
-        self._roi = None
-        self._kept_mask = None
-        self._analyzed = None
-        self._pseudolandmarks = None
+        self._backend = get_backend(backend)
+        self._segmentation_scale = segmentation_scale
+        self._writes = []
+        self._nodes = dict()
+
+    def compute(self, node):
+        """
+        Return the value of a graph node. The node and the nodes it
+        depends on are computed on first request only.
+        """
+        if node not in self._nodes:
+            dependencies, method = self.GRAPH[node]
+            inputs = [self.compute(dependency)
+                      for dependency in dependencies]
+            self._nodes[node] = getattr(self, method)(*inputs)
+        return self._nodes[node]
+
+    def output(self, name, print=False):
+        """
+        Return an output by name, printing or plotting it if asked.
+        """
+        if name not in OUTPUTS:
+            raise ValueError(f"Unknown transformation '{name}'.")
+        img = self.compute(OUTPUTS[name][0])
+        if print:
+            self._print_image(
+                img=img,
+                filename=output_filename(self.dst, name)
+            )
+        return img
+
+    def outputs(self, names, print=False):
+        """
+        Return the requested outputs, computing only the graph
+        nodes they need. Printed outputs are written in the background
+        while the next ones are computed, and are all written
+        when this returns.
+        """
+        images = {name: self.output(name, print) for name in names}
+        self.wait_writes()
+        return images
+
+    def wait_writes(self):
+        """
+        Wait for the outputs printed so far to be written,
+        raising the error of the first write that failed.
+        """
+        writes, self._writes = self._writes, []
+        get_writer().wait(writes)
 
     def get_images(self):
-        self.original(print=True)
-        if self._no_bg is None:
-            self.no_bg(print=True)
-        if self._disease_mask is None:
-            self.mask_disease(print=True)
-        if self._g_blur is None:
-            self.gaussian_blur(print=True)
-        if self._roi is None:
-            self.roi_objects(print=True)
-        if self._analyzed is None:
-            self.analyze_objects(print=True)
-        # if self._pseudolandmarks is None:
-        #     self.pseudolandmarks(print=True)
+        images = self.outputs(DEFAULT_OUTPUTS, print=True)
 
         def convert(img):
             return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-        return {
-            "original": convert(self.img),
-            "no_bg": convert(self._no_bg),
-            "mask": convert(self._disease_mask),
-            "blur": convert(self._g_blur),
-            "roi": convert(self._roi),
-            "analyze": convert(self._analyzed),
-            # "pseudolandmarks": convert(self._pseudolandmarks),
-        }
+        return {name: convert(img) for name, img in images.items()}
 
     def _print_image(self, img, filename):
         if self._pcv_option == "print":
-            pcv.print_image(
-                img=img,
-                filename=filename
-            )
+            self._writes.append(get_writer().write(img, filename))
         elif self._pcv_option == "plot":
             pcv.plot_image(img=img, title=filename,)
 
     def original(self, print=False):
-        # Save the original image
-        if print:
-            self._print_image(
-                img=self.img,
-                filename="{0}_original.JPG".format(self.dst)
-            )
-        return self.img
+        return self.output("original", print)
 
     def mask_disease(self, print=False):
-        mask = pcv.threshold.dual_channels(self.img,
-                                           x_channel="a",
-                                           y_channel="b",
-                                           points=[(55, 55), (100, 115)],
-                                           above=True
-                                           )
-
-        self._disease_mask = pcv.logical_xor(self._filled, mask)
-        if print:
-            self._print_image(
-                img=self._disease_mask,
-                filename="{0}_disease_mask.JPG".format(self.dst)
-            )
-        return self._disease_mask
+        return self.output("mask", print)
 
     def no_bg(self, print=False):
-        # Save the original image
-        self._no_bg = self.img.copy()
-        self._no_bg[self._filled == 0] = (0, 0, 0)
-        if print:
-            self._print_image(
-                img=self._no_bg,
-                filename="{0}_no_bg.JPG".format(self.dst)
-            )
-        return self._no_bg
+        return self.output("no_bg", print)
 
     def gaussian_blur(self, print=False):
-        if self._disease_mask is None:
-            self.mask_disease()
-
-        # Apply Gaussian blur to the filled image
-        self._g_blur = pcv.gaussian_blur(
-            img=self._disease_mask, ksize=(3, 3), sigma_x=0, sigma_y=0
-        )
-        if print:
-            self._print_image(
-                img=self._g_blur,
-                filename="{0}_gaussian_blur.JPG".format(self.dst)
-            )
-        return self._g_blur
+        return self.output("blur", print)
 
     def roi_objects(self, print=False):
-        if self._disease_mask is None:
-            self.mask_disease()
+        return self.output("roi", print)
+
+    def analyze_objects(self, print=False):
+        return self.output("analyze", print)
+
+    def pseudolandmarks(self, print=False):
+        return self.output("pseudolandmarks", print)
+
+    def landmarks(self):
+        """
+        Return the raw x axis pseudolandmarks as (20, 2) arrays
+        of (x, y) coordinates, keyed by 'top', 'bottom' and 'center_v'.
+        """
+        return self.compute("landmarks")
+
+    def color_histogram(self, display_func=None):
+        plot_histogram(self.img, self.compute("kept_mask"), display_func)
+
+    def _compute_original(self):
+        return self.img
+
+    def _compute_filled(self):
+        return foreground_mask(self.img, self._backend.name,
+                               self._segmentation_scale)
+
+    def _compute_disease_mask(self, filled):
+        mask = self._backend.disease_threshold(self.img)
+        return self._backend.logical_xor(filled, mask)
+
+    def _compute_no_bg(self, filled):
+        no_bg = self.img.copy()
+        no_bg[filled == 0] = (0, 0, 0)
+        return no_bg
+
+    def _compute_blur(self, disease_mask):
+        # Apply Gaussian blur to the filled image
+        return self._backend.gaussian_blur(disease_mask, (3, 3))
 
+    def _compute_kept_mask(self, disease_mask):
         # Create the ROI
-        roi = pcv.roi.rectangle(img=self._disease_mask, x=0, y=0,
+        roi = pcv.roi.rectangle(img=disease_mask, x=0, y=0,
                                 h=self.img.shape[0],
                                 w=self.img.shape[1])
 
         # Create a mask that we will inverse to get green spots
-        self._kept_mask = pcv.roi.filter(
-            mask=self._disease_mask, roi=roi, roi_type='partial',
+        return pcv.roi.filter(
+            mask=disease_mask, roi=roi, roi_type='partial',
         )
+
+    def _compute_roi(self, kept_mask):
         roi_image = self.img.copy()
-        roi_image[self._kept_mask != 0] = (0, 255, 0)
+        roi_image[kept_mask != 0] = (0, 255, 0)
 
         border_size = 5
         roi_image[:border_size, :] = (255, 0, 0)
         roi_image[-border_size:, :] = (255, 0, 0)
         roi_image[:, :border_size] = (255, 0, 0)
         roi_image[:, -border_size:] = (255, 0, 0)
+        return roi_image
 
-        self._roi = roi_image
-
-        if print:
-            self._print_image(
-                img=self._roi,
-                filename="{0}_roi_objects.JPG".format(self.dst)
-            )
-        # Save the mask
-        return self._roi
-
-    def analyze_objects(self, print=False):
-        if self._kept_mask is None:
-            self.roi_objects()
-
+    def _compute_analyze(self, kept_mask):
         # Analyze the objects in the mask
-        self._analyzed = pcv.analyze.size(
-            img=self.img, labeled_mask=self._kept_mask)
-        if print:
-            self._print_image(
-                img=self._analyzed,
-                filename="{0}_analyze_object.JPG".format(self.dst)
-            )
-        return self._analyzed
-
-    def pseudolandmarks(self, print=False):
-        if self._kept_mask is None:
-            self.roi_objects()
-
-        pcv.params.debug = "print"
-        # Create the pseudolandmarks
-        pcv.homology.x_axis_pseudolandmarks(
-            img=self.img, mask=self._kept_mask, label='default'
-        )
-        pcv.params.debug = None
-        filename = f"{str(pcv.params.device - 1)}_x_axis_pseudolandmarks.png"
+        return pcv.analyze.size(img=self.img, labeled_mask=kept_mask)
 
-        self._pseudolandmarks, _, _ = pcv.readimage(filename)
-        os.remove(filename)
+    def _compute_landmarks(self, kept_mask):
+        return x_axis_landmarks(self.img, kept_mask)
 
-        if print:
-            self._print_image(
-                img=self._pseudolandmarks,
-                filename="{0}_pseudolandmarks.JPG".format(self.dst)
-            )
-        return self._pseudolandmarks
+    def _compute_pseudolandmarks(self, landmarks):
+        return draw_landmarks(self.img, landmarks)
 
-    def color_histogram(self, display_func=None):
-        if self._kept_mask is None:
-            self.roi_objects()
 
-        plot_histogram(self.img, self._kept_mask, display_func)
+def read_image(path):
+    img, _, _ = pcv.readimage(filename=path)
+    return img
 
 
 def transformation_handler(img, dst, pcv_option, transformations):
     cls = ImgTransformation(img, dst, pcv_option)
     if transformations is not None and len(transformations) > 0:
-        images = dict()
-        for transform in transformations:
-            if transform == "original":
-                images["original"] = cls.original(print=True)
-            if transform == "no_bg":
-                images["no_bg"] = cls.no_bg(print=True)
-            if transform == "mask":
-                images["mask"] = cls.mask_disease(print=True)
-            if transform == "blur":
-                images["blur"] = cls.gaussian_blur(print=True)
-            if transform == "roi":
-                images["roi"] = cls.roi_objects(print=True)
-            if transform == "analyze":
-                images["analyze"] = cls.analyze_objects(print=True)
-            if transform == "pseudolandmarks":
-                images["pseudolandmarks"] = cls.pseudolandmarks(print=True)
-        return images
+        return cls.outputs(transformations, print=True)
     images = cls.get_images()
     if pcv_option == "plot":
         cls.color_histogram()
@@ -234,34 +285,8 @@ def transformation(path, dst, pcv_option="plot", transformations=None):
         path (_type_): img file path
         to be augmented
     """
-    if isinstance(path, str):
-        img, _, _ = pcv.readimage(filename=path)
-    else:
-        img = path
-
-    cls = ImgTransformation(img, dst, pcv_option)
-    if transformations is not None and len(transformations) > 0:
-        images = dict()
-        for transform in transformations:
-            if transform == "original":
-                images["original"] = cls.original(print=True)
-            if transform == "no_bg":
-                images["no_bg"] = cls.no_bg(print=True)
-            if transform == "mask":
-                images["mask"] = cls.mask_disease(print=True)
-            if transform == "blur":
-                images["blur"] = cls.gaussian_blur(print=True)
-            if transform == "roi":
-                images["roi"] = cls.roi_objects(print=True)
-            if transform == "analyze":
-                images["analyze"] = cls.analyze_objects(print=True)
-            if transform == "pseudolandmarks":
-                images["pseudolandmarks"] = cls.pseudolandmarks(print=True)
-        return images
-    images = cls.get_images()
-    if pcv_option == "plot":
-        cls.color_histogram()
-    return images
+    img = read_image(path) if isinstance(path, str) else path
+    return transformation_handler(img, dst, pcv_option, transformations)
 
 
 def transformation_from_img(img, displayFunc=None):
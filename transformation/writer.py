@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.util import Finalize
+import cv2
+
+
+# Format -> (file extension, OpenCV quality flag)
+IMAGE_FORMATS = {
+    "jpg": (".JPG", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", None),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+_settings = {
+    "threads": 0,
+    "max_pending": 16,
+    "image_format": "jpg",
+    "quality": 95,
+}
+_writer = None
+_finalizer = None
+
+
+def encode_image(img, image_format=None, quality=None):
+    """
+    Return the bytes of an image encoded in image_format,
+    the format of the outputs of this process by default.
+    """
+    if image_format is None:
+        image_format = _settings["image_format"]
+    if quality is None:
+        quality = _settings["quality"]
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}'. \
+Choose from {list(IMAGE_FORMATS)}.")
+    extension, flag = IMAGE_FORMATS[image_format]
+    ok, buffer = cv2.imencode(extension, img,
+                              [flag, quality] if flag is not None else [])
+    if not ok:
+        raise ValueError("Could not encode the image.")
+    return buffer.tobytes()
+
+
+class AsyncImageWriter:
+    """
+    Encode and write images on a pool of threads so the computation
+    of the next outputs overlaps with the I/O of the previous ones.
+    At most max_pending images wait to be written, write blocks
+    beyond that. With no threads, images are written on the spot.
+    Files are written atomically; failed writes nobody waited for
+    are reported when the writer is closed.
+    """
+
+    def __init__(self, threads=2, max_pending=16, image_format="jpg",
+                 quality=95):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format '{image_format}'. \
+Choose from {list(IMAGE_FORMATS)}.")
+        self.image_format = image_format
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(threads) if threads > 0 \
+            else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Writes nobody waited for yet, kept until they succeed
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def _write(self, img, filename):
+        data = encode_image(img, self.image_format, self.quality)
+        tmp_path = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filename)
+
+    def _done(self, future):
+        self._slots.release()
+        if future.exception() is None:
+            with self._lock:
+                self._pending.pop(future, None)
+
+    def write(self, img, filename):
+        """
+        Queue an image to be written to filename and return
+        the Future of the write. img must not be modified afterwards.
+        """
+        self._slots.acquire()
+        if self._executor is not None:
+            future = self._executor.submit(self._write, img, filename)
+        else:
+            future = Future()
+            try:
+                self._write(img, filename)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+        with self._lock:
+            self._pending[future] = filename
+        future.add_done_callback(self._done)
+        return future
+
+    def wait(self, futures):
+        """
+        Wait for writes to be done, raising the error of the first
+        one that failed.
+        """
+        errors = [future.exception() for future in futures]
+        with self._lock:
+            for future in futures:
+                self._pending.pop(future, None)
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def close(self):
+        """
+        Wait for the queued images to be written and report
+        the writes that failed.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            errors = [(filename, future.exception())
+                      for future, filename in self._pending.items()
+                      if future.exception() is not None]
+            self._pending.clear()
+        for filename, error in errors:
+            print(f"Failed to write {filename}: {str(error)}",
+                  file=sys.stderr)
+        return errors
+
+
+def configure_writer(threads=None, max_pending=None, image_format=None,
+                     quality=None):
+    """
+    Set the number of writer threads, the queue size, the image
+    format and the quality of the outputs printed by this process.
+    The images queued so far are written first.
+    """
+    global _writer, _finalizer
+    if image_format is not None and image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}'. \
+Choose from {list(IMAGE_FORMATS)}.")
+    for name, value in (("threads", threads), ("max_pending", max_pending),
+                        ("image_format", image_format),
+                        ("quality", quality)):
+        if value is not None:
+            _settings[name] = value
+    if _finalizer is not None:
+        _finalizer()
+        _writer = _finalizer = None
+
+
+def writer_settings():
+    """
+    Return a copy of the writer settings of this process.
+    """
+    return dict(_settings)
+
+
+def image_extension():
+    """
+    Return the file extension of the outputs printed by this process.
+    """
+    return IMAGE_FORMATS[_settings["image_format"]][0]
+
+
+def get_writer():
+    """
+    Return the image writer of this process. It is flushed at exit,
+    including in the worker processes of a pool, which skip atexit.
+    """
+    global _writer, _finalizer
+    if _writer is None:
+        _writer = AsyncImageWriter(**_settings)
+        _finalizer = Finalize(_writer, _writer.close, exitpriority=10)
+    return _writer
@@ -1,4 +1,6 @@
 from .arguments import Argument, StaticValidators
+from .parallel import print_progress, run_jobs
 
 
-__all__ = ["load", "Argument", "StaticValidators"]
+__all__ = ["load", "Argument", "StaticValidators",
+           "print_progress", "run_jobs"]
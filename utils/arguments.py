@@ -80,7 +80,7 @@ class Argument(ArgumentValidator):
         super().__init__()
 
     def add_argument(self, arg_name, type=None, help="",
-                     default=None, action=None, nargs=None):
+                     default=None, action=None, nargs=None, const=None):
         """
         This function adds an argument to the parser.
         """
@@ -89,6 +89,8 @@ class Argument(ArgumentValidator):
         }
         if nargs is not None:
             kwargs['nargs'] = nargs
+        if const is not None:
+            kwargs['const'] = const
 
         if action == 'store_true':
             kwargs['action'] = 'store_true'
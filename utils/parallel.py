@@ -0,0 +1,45 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def print_progress(count, total, failed=0):
+    """
+    This function prints the progress of a batch run on a single line.
+    """
+    percent = 100 * count / total if total else 100.0
+    print(f"{count}/{total} {percent:.1f}% ({failed} failed)", end="\r")
+
+
+def run_jobs(func, jobs, workers=1, initializer=None, initargs=()):
+    """
+    This function runs func on every job and yields (job, result, error)
+    as soon as each job is done.
+    With workers > 1 the jobs are spread across a process pool and
+    are yielded in completion order. A job raising an exception does
+    not stop the others, the exception is yielded as error instead.
+    Workers are spawned rather than forked: rembg, onnxruntime and
+    numba start thread pools that do not survive a fork.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for job in jobs:
+            try:
+                yield job, func(job), None
+            except Exception as e:
+                yield job, None, e
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers,
+                               initializer=initializer,
+                               initargs=initargs,
+                               mp_context=multiprocessing.get_context(
+                                   "spawn"))
+    try:
+        futures = {pool.submit(func, job): job for job in jobs}
+        for future in as_completed(futures):
+            error = future.exception()
+            result = future.result() if error is None else None
+            yield futures[future], result, error
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
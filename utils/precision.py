@@ -0,0 +1,58 @@
+import sys
+import keras
+
+
+PRECISIONS = ("float32", "mixed_bfloat16")
+# /proc/cpuinfo flags of the instructions computing in bfloat16
+BFLOAT16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def cpu_supports_bfloat16():
+    """
+    Return whether the CPU has bfloat16 instructions (AVX512-BF16 or
+    AMX), read from /proc/cpuinfo. Without them bfloat16 is emulated
+    and slower than float32.
+    """
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return any(flag in flags for flag in BFLOAT16_CPU_FLAGS)
+
+
+def configure_precision(precision="float32"):
+    """
+    Set the dtype policy of the models created afterwards and return
+    it. mixed_bfloat16 computes in bfloat16 and keeps the weights in
+    float32; it falls back to float32 on a CPU without bfloat16
+    instructions.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. \
+Choose from {list(PRECISIONS)}.")
+    if precision == "mixed_bfloat16" and not cpu_supports_bfloat16():
+        print("This CPU has no bfloat16 instructions, using float32.",
+              file=sys.stderr)
+        precision = "float32"
+    keras.mixed_precision.set_global_policy(precision)
+    return precision
+
+
+def with_precision(model, precision):
+    """
+    Return a Sequential model rebuilt with the dtype policy precision
+    and the weights of model, the policy of a saved model being the one
+    it was trained with. The output layer stays float32.
+    """
+    policies = [precision] * (len(model.layers) - 1) + ["float32"]
+    if [layer.dtype_policy.name for layer in model.layers] == policies:
+        return model
+    config = model.get_config()
+    layers = [layer for layer in config["layers"]
+              if layer["class_name"] != "InputLayer"]
+    for layer, policy in zip(layers, policies):
+        layer["config"]["dtype"] = policy
+    rebuilt = keras.Sequential.from_config(config)
+    rebuilt.set_weights(model.get_weights())
+    return rebuilt